@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Posts, Category, UserPreference, Interaction
+from .models import Posts, Category, UserPreference, Interaction, UserNeighbor, RecommenderJob
 # Register your models here.
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,4 +9,11 @@ admin.site.register(Posts, PostAdmin)
 admin.site.register(Category)
 admin.site.register(UserPreference)
 admin.site.register(Interaction)
+admin.site.register(UserNeighbor)
+
+class RecommenderJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'reason', 'requests', 'created_at', 'finished_at', 'model_version')
+    list_filter = ('kind', 'status')
+
+admin.site.register(RecommenderJob, RecommenderJobAdmin)
 
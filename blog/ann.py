@@ -0,0 +1,168 @@
+"""Neighbor engines for finding similar users in the interaction matrix.
+
+ExactUserIndex scores every user who shares a rated blog with the query user
+(InteractionMatrix.similar_users). RandomProjectionLSH is an approximate engine:
+each user's rating vector is hashed by the signs of ``n_bits`` random
+projections in each of ``n_tables`` tables. Users that land in the same bucket
+as the query user in any table become candidates, and the candidates are
+re-ranked by exact cosine similarity. More tables raise recall; more bits make
+buckets smaller and lookups faster. The LSH index is built offline by
+build_recommender and saved with the model version.
+"""
+import time
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_TABLES = 16
+DEFAULT_BITS = 8
+DEFAULT_MAX_CANDIDATES = 1000
+# Users hashed per block while building, bounding the dense projection buffer
+BUILD_BLOCK_ROWS = 65536
+
+
+class ExactUserIndex(object):
+    name = 'exact'
+
+    def __init__(self, interactions):
+        self.interactions = interactions
+
+    def attach(self, interactions):
+        self.interactions = interactions
+        return self
+
+    def similar_users(self, row, k):
+        return self.interactions.similar_users(row, k)
+
+
+class RandomProjectionLSH(object):
+    name = 'lsh'
+
+    def __init__(self, planes, codes, order, sorted_codes, max_candidates=DEFAULT_MAX_CANDIDATES):
+        self.planes = planes
+        # codes[t, row] is the bucket of user ``row`` in table t; order[t] lists rows sorted by bucket
+        self.codes = codes
+        self.order = order
+        self.sorted_codes = sorted_codes
+        self.max_candidates = max_candidates
+        self.interactions = None
+        self.normalized = None
+
+    @property
+    def n_tables(self):
+        return self.codes.shape[0]
+
+    @property
+    def n_bits(self):
+        return self.planes.shape[1] // self.n_tables
+
+    @classmethod
+    def build(cls, interactions, n_tables=DEFAULT_TABLES, n_bits=DEFAULT_BITS, max_candidates=DEFAULT_MAX_CANDIDATES, seed=0):
+        if not 1 <= n_bits <= 63:
+            raise ValueError('n_bits must be between 1 and 63.')
+        rng = np.random.default_rng(seed)
+        n_users, n_items = interactions.shape
+        planes = rng.standard_normal((n_items, n_tables * n_bits), dtype=np.float32)
+        codes = np.empty((n_tables, n_users), dtype=np.uint64)
+        for start in range(0, n_users, BUILD_BLOCK_ROWS):
+            block = interactions.matrix[start:start + BUILD_BLOCK_ROWS]
+            codes[:, start:start + block.shape[0]] = cls._hash(block @ planes, n_tables, n_bits)
+        order = np.argsort(codes, axis=1, kind='stable').astype(np.int32)
+        sorted_codes = np.take_along_axis(codes, order, axis=1)
+        index = cls(planes, codes, order, sorted_codes, max_candidates)
+        return index.attach(interactions)
+
+    @staticmethod
+    def _hash(projections, n_tables, n_bits):
+        """Pack the sign bits of each table's projections into one uint64 code per user."""
+        bits = (np.asarray(projections) > 0).reshape(-1, n_tables, n_bits)
+        weights = np.left_shift(np.uint64(1), np.arange(n_bits, dtype=np.uint64))
+        return (bits.astype(np.uint64) * weights).sum(axis=2, dtype=np.uint64).T
+
+    def attach(self, interactions):
+        """Bind the index to the interaction matrix used to re-rank candidates."""
+        self.interactions = interactions
+        inverse_norms = np.divide(1.0, interactions.norms, out=np.zeros_like(interactions.norms), where=interactions.norms > 0)
+        self.normalized = (sparse.diags(inverse_norms.astype(np.float32)) @ interactions.matrix).tocsr()
+        return self
+
+    def candidates(self, row):
+        """Rows sharing a bucket with ``row`` in at least one table, most collisions first when capped."""
+        found = []
+        for table in range(self.n_tables):
+            code = self.codes[table, row]
+            begin = np.searchsorted(self.sorted_codes[table], code, side='left')
+            end = np.searchsorted(self.sorted_codes[table], code, side='right')
+            found.append(self.order[table, begin:end])
+        candidates, collisions = np.unique(np.concatenate(found), return_counts=True)
+        keep = candidates != row
+        candidates, collisions = candidates[keep], collisions[keep]
+        if len(candidates) > self.max_candidates:
+            candidates = candidates[np.argpartition(-collisions, self.max_candidates - 1)[:self.max_candidates]]
+        return candidates
+
+    def similar_users(self, row, k):
+        """Approximate top ``k`` users by cosine similarity to ``row``."""
+        if row >= self.codes.shape[1]:
+            # Not hashed at build time
+            return self.interactions.similar_users(row, k)
+        candidates = self.candidates(row)
+        similarities = np.asarray(self.normalized[candidates] @ self.normalized[row].T.toarray()).ravel()
+        keep = similarities > 0
+        candidates, similarities = candidates[keep], similarities[keep]
+        if len(candidates) > k:
+            top = np.argpartition(-similarities, k - 1)[:k]
+            candidates, similarities = candidates[top], similarities[top]
+        order = np.argsort(-similarities, kind='stable')
+        return candidates[order], similarities[order].astype(np.float32)
+
+    def save(self, path):
+        np.savez(path, planes=self.planes, codes=self.codes, order=self.order, sorted_codes=self.sorted_codes,
+                 max_candidates=np.int64(self.max_candidates))
+
+    @classmethod
+    def load(cls, path, interactions):
+        data = np.load(path)
+        index = cls(data['planes'], data['codes'], data['order'], data['sorted_codes'], int(data['max_candidates']))
+        return index.attach(interactions)
+
+
+ENGINES = {
+    ExactUserIndex.name: ExactUserIndex,
+    RandomProjectionLSH.name: RandomProjectionLSH,
+}
+
+
+def build_user_index(interactions, engine, **options):
+    """Build the named engine over ``interactions``; the exact engine needs no build step."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown neighbor engine '{engine}'; expected one of {', '.join(sorted(ENGINES))}.")
+    if engine == ExactUserIndex.name:
+        return ExactUserIndex(interactions)
+    return ENGINES[engine].build(interactions, **options)
+
+
+def recall_report(interactions, index, rows, k):
+    """Recall@k of ``index`` against exact search over ``rows``, with per-query latencies in ms."""
+    exact = ExactUserIndex(interactions)
+    recalls = []
+    exact_ms = []
+    approximate_ms = []
+    for row in rows:
+        start = time.perf_counter()
+        truth, _ = exact.similar_users(row, k)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        found, _ = index.similar_users(row, k)
+        approximate_ms.append((time.perf_counter() - start) * 1000)
+        if len(truth):
+            recalls.append(len(np.intersect1d(truth, found)) / len(truth))
+    return {
+        'queries': len(rows),
+        'k': k,
+        'recall': float(np.mean(recalls)) if recalls else None,
+        'exact_p50_ms': float(np.percentile(exact_ms, 50)) if exact_ms else None,
+        'exact_p95_ms': float(np.percentile(exact_ms, 95)) if exact_ms else None,
+        'approximate_p50_ms': float(np.percentile(approximate_ms, 50)) if approximate_ms else None,
+        'approximate_p95_ms': float(np.percentile(approximate_ms, 95)) if approximate_ms else None,
+    }
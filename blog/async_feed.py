@@ -0,0 +1,76 @@
+"""Thread pools and timeouts behind the async feed and search views.
+
+ORM calls of an async view run on a small database pool, so independent queries
+of one request overlap instead of running one after another; each pool thread
+keeps its own connection, like a WSGI worker thread. Loading and scoring the
+recommender runs on a separate, smaller pool and never on the event loop.
+
+The scoring pool is bounded twice: a request that finds
+RECOMMENDER_ASYNC_MAX_PENDING jobs already queued or running gets Overloaded
+straight away, and one whose job takes longer than RECOMMENDER_ASYNC_TIMEOUT
+seconds gets a TimeoutError. The views answer both with the popularity feed. A
+timed-out job that has already started keeps running and fills the
+recommendation cache for the user's next request.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executors = {}
+_lock = threading.Lock()
+_pending = 0
+
+
+class Overloaded(Exception):
+    """The scoring pool already has RECOMMENDER_ASYNC_MAX_PENDING jobs."""
+
+
+def _executor(name, max_workers):
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'blog-{name}')
+        return _executors[name]
+
+
+def _call(function, args):
+    # Honour CONN_MAX_AGE and drop broken connections, as request_started/finished do
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+def _job_done(future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+async def run_query(function, *args):
+    """Run the ORM code ``function(*args)`` on the database pool."""
+    executor = _executor('db', settings.RECOMMENDER_ASYNC_DB_THREADS)
+    return await asyncio.get_running_loop().run_in_executor(executor, _call, function, args)
+
+
+async def run_scoring(function, *args):
+    """Run ``function(*args)`` on the scoring pool and wait at most RECOMMENDER_ASYNC_TIMEOUT seconds.
+
+    Raises Overloaded if the pool is saturated and TimeoutError on timeout; a job
+    still queued at the timeout is cancelled.
+    """
+    global _pending
+    with _lock:
+        if _pending >= settings.RECOMMENDER_ASYNC_MAX_PENDING:
+            raise Overloaded()
+        _pending += 1
+    try:
+        future = _executor('scoring', settings.RECOMMENDER_ASYNC_SCORING_THREADS).submit(_call, function, args)
+    except BaseException:
+        _job_done(None)
+        raise
+    future.add_done_callback(_job_done)
+    return await asyncio.wait_for(asyncio.wrap_future(future), settings.RECOMMENDER_ASYNC_TIMEOUT)
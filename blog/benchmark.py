@@ -0,0 +1,140 @@
+"""Stage-by-stage benchmark of HybridRecommender on synthetic data.
+
+run_benchmark() fits the recommender the same way HybridRecommender.__init__
+does, but one stage at a time. It records wall time and the process's peak
+RSS after each stage, then times the per-user query paths over a sample of
+users. The peak RSS is a high-water mark for the whole process, so run one
+scale per process when comparing memory between versions.
+"""
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .hybridRS import HybridRecommender
+from .factorization import fit_factorization
+from .interactions import InteractionMatrix
+from .neighbors import ContentNeighborIndex
+from .synthetic import generate_dataset
+from .text_processing import english_stopwords, get_preprocessor
+
+SCALES = {
+    'small': {'posts': 1_000, 'users': 2_000, 'ratings': 50_000},
+    'medium': {'posts': 10_000, 'users': 20_000, 'ratings': 250_000},
+    'large': {'posts': 100_000, 'users': 100_000, 'ratings': 1_000_000},
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+class StageTimer(object):
+
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.stages.append({'stage': name, 'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()})
+        return result
+
+    def run_per_user(self, name, function, user_ids):
+        """Time ``function(user_id)`` for every user and record the total and per-call latency."""
+        latencies = np.empty(len(user_ids))
+        start = time.perf_counter()
+        for i, user_id in enumerate(user_ids):
+            call_start = time.perf_counter()
+            function(user_id)
+            latencies[i] = time.perf_counter() - call_start
+        stage = {'stage': name, 'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb(), 'calls': len(user_ids)}
+        if len(user_ids):
+            stage.update({
+                'mean_ms': float(latencies.mean() * 1000),
+                'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                'p95_ms': float(np.percentile(latencies, 95) * 1000),
+                'max_ms': float(latencies.max() * 1000),
+            })
+        self.stages.append(stage)
+
+
+def fit_stages(timer, blog_df, rating_df, preferences_df, n_jobs=1):
+    """Fit a HybridRecommender with each step of its constructor timed separately."""
+    blog_df = blog_df.drop_duplicates(['title', 'content']).reset_index(drop=True)
+    interactions = timer.run('interaction_matrix', InteractionMatrix.from_ratings, rating_df)
+
+    preprocessor = get_preprocessor(flg_stemm=False, flg_lemm=True, stopwords=english_stopwords())
+    blog_df['clean_blog_content'] = timer.run('preprocessing', preprocessor.process_many, blog_df['content'], n_jobs=n_jobs)
+    tfidf_vectorizer = TfidfVectorizer()
+    tfidf_matrix = timer.run('tfidf_fit', tfidf_vectorizer.fit_transform, blog_df['clean_blog_content'])
+    content_neighbors = timer.run('content_similarity', ContentNeighborIndex.build, tfidf_matrix)
+
+    recommender = HybridRecommender.from_fitted(
+        blog_df, interactions, tfidf_vectorizer, tfidf_matrix, content_neighbors, popularity_df=None,
+    )
+    recommender.preferences_df = preferences_df
+    recommender.popularity_df = timer.run('sort_blogs_by_average_rating', recommender.sort_blogs_by_average_rating)
+    return recommender
+
+
+def run_benchmark(name, posts, users, ratings, seed=0, n_jobs=1, sample_users=200, factorization='svd'):
+    """Benchmark one scale and return its results as a JSON-serializable dict.
+
+    The collaborative step is timed with both user kNN and ``factorization``
+    ('svd' or 'als') factors so the two backends can be compared.
+    """
+    timer = StageTimer()
+    blog_df, rating_df, preferences_df = timer.run(
+        'generate_data', generate_dataset, posts, users, ratings, seed=seed,
+    )
+    recommender = fit_stages(timer, blog_df, rating_df, preferences_df, n_jobs=n_jobs)
+
+    rng = np.random.default_rng(seed)
+    user_ids = recommender.interactions.user_ids
+    sample = rng.choice(user_ids, size=min(sample_users, len(user_ids)), replace=False).tolist()
+    timer.run_per_user('content_recommendations', recommender.get_content_based_recommendations, sample)
+    timer.run_per_user('collaborative_knn', recommender.get_collaborative_recommendations, sample)
+    timer.run_per_user('recommend_blogs', lambda user_id: recommender.recommend_blogs(user_id, []), sample)
+
+    recommender.factors = timer.run(
+        f'factorization_fit_{factorization}', fit_factorization, recommender.interactions, factorization, n_jobs=n_jobs,
+    )
+    timer.run_per_user(
+        f'factorization_{factorization}_recommendations',
+        lambda user_id: recommender.get_collaborative_recommendations(user_id, backend=factorization), sample,
+    )
+
+    return {
+        'scale': name,
+        'seed': seed,
+        'posts': len(recommender.blog_df),
+        'users': int(recommender.interactions.shape[0]),
+        'ratings': int(recommender.interactions.nnz),
+        'vocabulary': len(recommender.tfidf_vectorizer.vocabulary_),
+        'jobs': n_jobs,
+        'stages': timer.stages,
+    }
@@ -1,42 +1,189 @@
+import copy
 import sys
 import pandas as pd
 import numpy as np
-import nltk
-import re
-from nltk import corpus
-from nltk.stem import WordNetLemmatizer
-from nltk.stem import PorterStemmer
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from nltk import wsd
 from nltk.corpus import wordnet as wn
 from sklearn.feature_extraction.text import CountVectorizer
 from collections import defaultdict
-from sklearn.neighbors import NearestNeighbors
+from scipy import sparse
+from .interactions import InteractionMatrix
+from .neighbors import ContentNeighborIndex, DEFAULT_NEIGHBORS, DEFAULT_THRESHOLD
+from .term_postings import TermPostings
+from .text_processing import english_stopwords, get_preprocessor
+from .metrics import stage
+
+# Number of posts returned by recommend_blogs
+FEED_SIZE = 20
+# Relative weight of each source when fusing scores in recommend_blogs
+DEFAULT_FUSION_WEIGHTS = {'content': 1.0, 'collaborative': 1.0}
+# (mean, weight) of the virtual ratings every post starts with in the popularity ranking
+DEFAULT_POPULARITY_PRIOR = (3.0, 5)
 
-nltk.download('wordnet')
-nltk.download('omw-1.4')
-nltk.download('punkt')
-nltk.download('stopwords')
 
 class HybridRecommender(object):
 
-    def __init__(self, blog_df, rating_df, preferences_df):
+    def __init__(self, blog_df, rating_df, preferences_df, n_neighbors=DEFAULT_NEIGHBORS, similarity_threshold=DEFAULT_THRESHOLD, n_jobs=1,
+                 popularity_prior=DEFAULT_POPULARITY_PRIOR):
         self.blog_df = blog_df
         self.rating_df = rating_df
         self.preferences_df = preferences_df
+        self.popularity_prior = popularity_prior
 
         # Remove duplicates
         self.blog_df.drop_duplicates(['title', 'content'], inplace=True)
+        self.blog_df.reset_index(drop=True, inplace=True)
+        with stage('fit.interactions'):
+            self.interactions = InteractionMatrix.from_ratings(self.rating_df)
 
         # Preprocess the blog content
-        lst_stopwords = corpus.stopwords.words('english')
-        self.blog_df['clean_blog_content'] = self.blog_df['content'].apply(
-            lambda x: self.pre_process_text(x, flg_stemm=False, flg_lemm=True, lst_stopwords=lst_stopwords)
-        )
-        self.tfidf_vectorizer = TfidfVectorizer()
-        self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(self.blog_df['clean_blog_content'])
-        self.cosine_sim = cosine_similarity(self.tfidf_matrix)
+        preprocessor = get_preprocessor(flg_stemm=False, flg_lemm=True, stopwords=english_stopwords())
+        with stage('fit.preprocessing'):
+            self.blog_df['clean_blog_content'] = preprocessor.process_many(self.blog_df['content'], n_jobs=n_jobs)
+        with stage('fit.tfidf'):
+            self.tfidf_vectorizer = TfidfVectorizer()
+            self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(self.blog_df['clean_blog_content'])
+        with stage('fit.content_similarity'):
+            self.content_neighbors = ContentNeighborIndex.build(self.tfidf_matrix, k=n_neighbors, threshold=similarity_threshold)
+        with stage('fit.popularity'):
+            self.popularity_df = self.sort_blogs_by_average_rating()
+        # Engine used to find similar users; None searches the interaction matrix exactly
+        self.user_index = None
+        # Optional MatrixFactorization, used for collaborative recommendations unless the backend is 'knn'
+        self.factors = None
+        self.collaborative_backend = 'knn'
+        self.fusion_weights = dict(DEFAULT_FUSION_WEIGHTS)
+        self.updates_since_fit = 0
+        # Highest Interaction id in the training data, set by model_store.build_model()
+        self.max_interaction_id = None
+        self._term_postings = None
+        self._blog_rows = None
+
+    @classmethod
+    def from_fitted(cls, blog_df, interactions, tfidf_vectorizer, tfidf_matrix, content_neighbors, popularity_df):
+        """Rebuild a recommender from previously fitted parts without refitting TF-IDF."""
+        recommender = cls.__new__(cls)
+        recommender.blog_df = blog_df
+        recommender.interactions = interactions
+        recommender.preferences_df = pd.DataFrame(columns=['user_id', 'preference'])
+        recommender.tfidf_vectorizer = tfidf_vectorizer
+        recommender.tfidf_matrix = tfidf_matrix
+        recommender.content_neighbors = content_neighbors
+        recommender.popularity_df = popularity_df
+        recommender.popularity_prior = DEFAULT_POPULARITY_PRIOR
+        recommender.user_index = None
+        recommender.factors = None
+        recommender.collaborative_backend = 'knn'
+        recommender.fusion_weights = dict(DEFAULT_FUSION_WEIGHTS)
+        recommender.updates_since_fit = 0
+        recommender.max_interaction_id = None
+        recommender._term_postings = None
+        recommender._blog_rows = None
+        return recommender
+
+    @property
+    def term_postings(self):
+        """Inverted index of the TF-IDF matrix, kept current by upsert_post and remove_post."""
+        if self._term_postings is None:
+            self._term_postings = TermPostings.build(self.tfidf_matrix)
+        return self._term_postings
+
+    def search(self, query, k=20):
+        """Rank posts by cosine similarity between ``query`` and their TF-IDF vectors.
+
+        Only the postings of the query's terms are touched, and the top ``k`` are
+        picked with a partial selection rather than a full sort.
+        """
+        clean_query = get_preprocessor(flg_stemm=False, flg_lemm=True, stopwords=english_stopwords()).process(query)
+        query_vector = self.tfidf_vectorizer.transform([clean_query])
+        if query_vector.nnz == 0:
+            return []
+        scores = self.term_postings.scores(self.tfidf_matrix, query_vector)
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        blog_ids = self.blog_df['blog_id'].values
+        return [(int(blog_ids[row]), float(scores[row])) for row in candidates]
+
+    @property
+    def blog_rows(self):
+        """Index from blog_id to its row in blog_df, tfidf_matrix and content_neighbors."""
+        if self._blog_rows is None:
+            self._blog_rows = pd.Index(self.blog_df['blog_id'].to_numpy())
+        return self._blog_rows
+
+    def _rows_of(self, blog_ids):
+        rows = self.blog_rows.get_indexer(blog_ids)
+        return rows[rows >= 0]
+
+    def _row_of(self, blog_id):
+        row = self.blog_rows.get_indexer([blog_id])[0]
+        return row if row >= 0 else None
+
+    def copy_for_update(self):
+        """Copy to apply upsert_post/remove_post to while this instance keeps serving.
+
+        The parts those methods change in place are copied; the rest is shared
+        until remove_post replaces it with a changed copy.
+        """
+        clone = copy.copy(self)
+        clone.blog_df = self.blog_df.copy()
+        clone.content_neighbors = self.content_neighbors.copy()
+        if self._term_postings is not None:
+            clone._term_postings = self._term_postings.copy()
+        return clone
+
+    def upsert_post(self, blog_id, title, content, category):
+        """Project a new or edited post into the fitted TF-IDF space and refresh its neighbors.
+
+        Terms missing from the fitted vocabulary are ignored until the next full rebuild.
+        """
+        clean_content = get_preprocessor(flg_stemm=False, flg_lemm=True, stopwords=english_stopwords()).process(content)
+        vector = self.tfidf_vectorizer.transform([clean_content])
+        row = self._row_of(blog_id)
+        if row is None:
+            row = len(self.blog_df)
+            self.blog_df.loc[row, ['blog_id', 'title', 'category__catName']] = [blog_id, title, category]
+            self.blog_df['blog_id'] = self.blog_df['blog_id'].astype(np.int64)
+            self.tfidf_matrix = sparse.vstack([self.tfidf_matrix, vector], format='csr')
+            self.content_neighbors.append_rows(1)
+            self._blog_rows = None
+        else:
+            self.blog_df.loc[row, ['title', 'category__catName']] = [title, category]
+            self.tfidf_matrix = sparse.vstack([self.tfidf_matrix[:row], vector, self.tfidf_matrix[row + 1:]], format='csr')
+
+        similarities = (self.tfidf_matrix @ vector.T).toarray().ravel()
+        self.content_neighbors.update_row(row, similarities)
+        if self._term_postings is not None:
+            self._term_postings.update_row(row)
+        self.updates_since_fit += 1
+
+    def remove_post(self, blog_id):
+        """Drop a deleted post, its ratings and every neighbor edge pointing at it."""
+        row = self._row_of(blog_id)
+        if row is None:
+            return
+        self.blog_df = self.blog_df.drop(index=row).reset_index(drop=True)
+        self._blog_rows = None
+        self.tfidf_matrix = sparse.vstack([self.tfidf_matrix[:row], self.tfidf_matrix[row + 1:]], format='csr')
+        self.content_neighbors.delete_row(row)
+        column = self.interactions.blog_column(blog_id)
+        if column is not None:
+            # Replace rather than modify: see copy_for_update()
+            interactions = self.interactions.copy()
+            interactions.drop_blog(blog_id)
+            if self.factors is not None:
+                self.factors = self.factors.copy()
+                self.factors.drop_item(column)
+            if self.user_index is not None:
+                self.user_index = copy.copy(self.user_index).attach(interactions)
+            self.interactions = interactions
+        self.popularity_df = self.popularity_df[self.popularity_df['blog_id'] != blog_id].reset_index(drop=True)
+        if self._term_postings is not None:
+            self._term_postings.delete_row(row)
+        self.updates_since_fit += 1
 
     @staticmethod
     def validate_preferences(user_preferences):
@@ -48,29 +195,47 @@ class HybridRecommender(object):
     @staticmethod
     def pre_process_text(text, flg_stemm=False, flg_lemm=True, lst_stopwords=None):
         """Preprocess text by cleaning, removing stopwords, and applying stemming/lemmatization."""
-        text = str(text).lower().strip()
-        text = re.sub(r'[^\w\s]', '', text)
-        lst_text = text.split()
-        if lst_stopwords is not None:
-            lst_text = [word for word in lst_text if word not in lst_stopwords]
-        if flg_lemm:
-            lemmatizer = WordNetLemmatizer()
-            lst_text = [lemmatizer.lemmatize(word) for word in lst_text]
-        if flg_stemm:
-            stemmer = PorterStemmer()
-            lst_text = [stemmer.stem(word) for word in lst_text]
-        return " ".join(lst_text)
-
-    def get_content_based_recommendations(self, user_id):
-        """Get recommendations based on blog content similarity."""
-        user_ratings = self.rating_df[self.rating_df['user_id'] == user_id]
-        high_rated_blogs = user_ratings[user_ratings['rating'] >= 3.5]['blog_id'].values
-        recommended_blogs = []
-        for blog_id in high_rated_blogs:
-            temp_id = self.blog_df[self.blog_df['blog_id'] == blog_id].index.values[0]
-            similar_blogs = self.blog_df[self.cosine_sim[temp_id] > 0.2]['blog_id'].values
-            recommended_blogs.extend([b for b in similar_blogs if b not in high_rated_blogs])
-        return recommended_blogs
+        stopwords = frozenset(lst_stopwords) if lst_stopwords is not None else None
+        return get_preprocessor(flg_stemm, flg_lemm, stopwords).process(text)
+
+    def content_scores(self, user_id, n_recommendations=20):
+        """Return ``(blog_ids, scores)`` of the top unseen posts by summed similarity to the user's liked posts.
+
+        Only the stored neighbor lists of the liked posts are read, so the cost grows
+        with liked posts x neighbors rather than with the corpus.
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        row = self.interactions.user_row(user_id)
+        if row is None:
+            return empty
+        rated_columns, ratings = self.interactions.user_ratings(row)
+        rated_blog_ids = self.interactions.blog_ids[rated_columns]
+        liked_rows = self._rows_of(rated_blog_ids[ratings >= 3.5])
+
+        neighbor_ids = self.content_neighbors.neighbor_ids[liked_rows].ravel()
+        neighbor_scores = self.content_neighbors.neighbor_scores[liked_rows].ravel()
+        listed = neighbor_ids >= 0
+        # One sparse row whose duplicate entries are summed: total similarity per candidate
+        totals = sparse.csr_matrix(
+            (neighbor_scores[listed], neighbor_ids[listed], [0, int(listed.sum())]), shape=(1, len(self.blog_df))
+        )
+        totals.sum_duplicates()
+        candidates, scores = totals.indices, totals.data
+
+        unseen = ~np.isin(candidates, self._rows_of(rated_blog_ids))
+        candidates, scores = candidates[unseen], scores[unseen]
+        if len(candidates) == 0:
+            return empty
+        if len(candidates) > n_recommendations:
+            top = np.argpartition(-scores, n_recommendations - 1)[:n_recommendations]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return self.blog_df['blog_id'].to_numpy()[candidates[order]], scores[order]
+
+    def get_content_based_recommendations(self, user_id, n_recommendations=20):
+        """Get recommendations based on blog content similarity, best first."""
+        blog_ids, _ = self.content_scores(user_id, n_recommendations)
+        return blog_ids.tolist()
 
     # def get_genre_recommendations(self, user_id, user_preferences):
     #     """Get recommendations based on genre/topic preferences."""
@@ -95,53 +260,125 @@ class HybridRecommender(object):
     #     recommended_blogs = merged_df[merged_df['user_id'] == most_similar_user_id].sort_values(by='rating', ascending=False)[['blog_id', 'category__catName']]
     #     return recommended_blogs['blog_id'].tolist(), self.preferences_df
 
-    def get_collaborative_recommendations(self, user_id):
-        """Get recommendations using collaborative filtering."""
-        # Create a pivot table
-        user_blog_matrix = self.rating_df.pivot(index='user_id', columns='blog_id', values='rating').fillna(0)
+    def collaborative_scores(self, user_id, n_neighbors=5, n_recommendations=5, user_neighbors=None, backend=None):
+        """Return ``(blog_ids, scores)`` of the top unrated posts from collaborative filtering.
+
+        ``backend`` is 'knn' or the method of the fitted factors ('svd'/'als') and
+        defaults to ``self.collaborative_backend``. For kNN, ``user_neighbors`` is an
+        optional precomputed list of ``(neighbor_id, similarity)`` pairs; without it
+        the neighbors are searched in the rating matrix.
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        row = self.interactions.user_row(user_id)
+        if row is None:
+            return empty
+        rated_columns, _ = self.interactions.user_ratings(row)
 
-        # Fit the NearestNeighbors model
-        model_knn = NearestNeighbors(metric='cosine', algorithm='auto')
-        model_knn.fit(user_blog_matrix)
+        if (backend or self.collaborative_backend) != 'knn' and self.factors is not None:
+            columns = self.factors.recommend(row, rated_columns, n_recommendations)
+            return self.interactions.blog_ids[columns], self.factors.scores(row)[columns]
 
-        # Find the k nearest neighbors
-        user_index = user_blog_matrix.index.tolist().index(user_id)
-        distances, indices = model_knn.kneighbors([user_blog_matrix.iloc[user_index]], n_neighbors=6)
+        if user_neighbors is not None:
+            pairs = [(self.interactions.user_row(neighbor_id), similarity) for neighbor_id, similarity in user_neighbors]
+            pairs = [(neighbor, similarity) for neighbor, similarity in pairs if neighbor is not None][:n_neighbors]
+            similar_users = np.array([neighbor for neighbor, _ in pairs], dtype=np.int64)
+            similarities = np.array([similarity for _, similarity in pairs], dtype=np.float32)
+        else:
+            # Find the k nearest neighbors, exactly among users who share a rated blog or through the ANN engine
+            user_index = self.user_index if self.user_index is not None else self.interactions
+            similar_users, similarities = user_index.similar_users(row, n_neighbors)
+        if len(similar_users) == 0:
+            return empty
 
-        # Aggregate ratings from neighbors
-        similar_users_indices = indices.flatten()[1:]
-        similar_users = user_blog_matrix.iloc[similar_users_indices]
-        mean_ratings = similar_users.mean(axis=0)
+        # Aggregate ratings from neighbors, weighted by similarity
+        weights = similarities / similarities.sum()
+        mean_ratings = np.asarray(self.interactions.matrix[similar_users].T @ weights).ravel()
 
         # Filter out blogs already rated by the user
-        rated_blogs = user_blog_matrix.loc[user_id]
-        unrated_blogs = rated_blogs[rated_blogs == 0].index
-        recommended_blogs = mean_ratings[unrated_blogs].sort_values(ascending=False).head(5)
+        mean_ratings[rated_columns] = 0
+        candidates = np.flatnonzero(mean_ratings)
+        if len(candidates) > n_recommendations:
+            candidates = candidates[np.argpartition(-mean_ratings[candidates], n_recommendations - 1)[:n_recommendations]]
+        candidates = candidates[np.argsort(-mean_ratings[candidates], kind='stable')]
+
+        return self.interactions.blog_ids[candidates], mean_ratings[candidates]
 
-        return recommended_blogs.index.tolist()
+    def get_collaborative_recommendations(self, user_id, n_neighbors=5, n_recommendations=5, user_neighbors=None, backend=None):
+        """Get recommendations using collaborative filtering, best first; see collaborative_scores()."""
+        blog_ids, _ = self.collaborative_scores(user_id, n_neighbors, n_recommendations, user_neighbors, backend)
+        return blog_ids.tolist()
 
-    def recommend_blogs(self, user_id, user_preferences):
-        """Unified recommendation function."""
+    def recommend_blogs(self, user_id, user_preferences, user_neighbors=None, backend=None, weights=None, n=FEED_SIZE,
+                        popular=None):
+        """Unified recommendation function.
+
+        Each source's scores are scaled to [0, 1] by its best score and summed with
+        ``weights`` (default ``self.fusion_weights``), so a post found by both sources
+        ranks higher. Shortfalls are padded with score 0 from ``popular(k)``, a
+        callable returning the ``k`` most popular blog ids such as Posts.most_popular,
+        or from the model's own popularity ranking when it is None.
+        Returns the top ``n`` as a DataFrame in rank order.
+        """
+        weights = weights or self.fusion_weights
         # genre_recommendations, top_topics_df = self.get_genre_recommendations(user_id, user_preferences)
-        content_recommendations = self.get_content_based_recommendations(user_id)
-        collaborative_recommendations = self.get_collaborative_recommendations(user_id)
+        with stage('recommend.content'):
+            content_ids, content_scores = self.content_scores(user_id, n)
+        with stage('recommend.collaborative'):
+            collaborative_ids, collaborative_scores = self.collaborative_scores(
+                user_id, n_recommendations=n, user_neighbors=user_neighbors, backend=backend,
+            )
 
-        # Combine all recommendations
-        all_recommendations = set(content_recommendations + collaborative_recommendations)# genre_recommendations 
+        with stage('recommend.merge'):
+            sources = [
+                (content_ids, content_scores, weights.get('content', 0.0)),
+                (collaborative_ids, collaborative_scores, weights.get('collaborative', 0.0)),
+            ]
+            blog_ids = np.concatenate([ids for ids, _, _ in sources]).astype(np.int64)
+            scores = np.concatenate([
+                scores * (weight / scores.max()) if len(scores) and scores.max() > 0 else np.zeros(len(scores))
+                for _, scores, weight in sources
+            ])
+            candidates, position = np.unique(blog_ids, return_inverse=True)
+            fused = np.bincount(position, weights=scores, minlength=len(candidates))
+            if len(candidates) > n:
+                top = np.argpartition(-fused, n - 1)[:n]
+                candidates, fused = candidates[top], fused[top]
+            order = np.argsort(-fused, kind='stable')
+            ranked_ids, ranked_scores = candidates[order].tolist(), fused[order].tolist()
 
-        # Cap recommendations to 20
-        recommended_blogs = self.blog_df[self.blog_df['blog_id'].isin(all_recommendations)][['blog_id', 'title', 'category__catName']]
-        if len(recommended_blogs) < 20:
-            sorted_blogs = self.sort_blogs_by_average_rating()
-            remaining_blogs = 20 - len(recommended_blogs)
-            additional_blogs = sorted_blogs.head(remaining_blogs)
-            recommended_blogs = pd.concat([recommended_blogs, additional_blogs])
+        if len(ranked_ids) < n:
+            with stage('recommend.popularity_fill'):
+                chosen = set(ranked_ids)
+                if popular is None:
+                    popular_ids = self.popularity_df['blog_id'].to_numpy()[:n + len(chosen)]
+                else:
+                    popular_ids = popular(n + len(chosen))
+                for blog_id in popular_ids:
+                    if len(ranked_ids) == n:
+                        break
+                    if blog_id not in chosen:
+                        ranked_ids.append(int(blog_id))
+                        ranked_scores.append(0.0)
 
-        return recommended_blogs.head(20)
+        rows = self.blog_rows.get_indexer(ranked_ids)
+        known = rows >= 0
+        recommended_blogs = self.blog_df.iloc[rows[known]][['blog_id', 'title', 'category__catName']]
+        return recommended_blogs.assign(score=np.asarray(ranked_scores, dtype=float)[known])
 
     def sort_blogs_by_average_rating(self):
-        """Sort blogs by average ratings."""
-        blog_ratings_avg = self.rating_df.groupby('blog_id')['rating'].mean().reset_index()
-        blog_ratings_avg.columns = ['blog_id', 'avg_rating']
-        sorted_blogs = pd.merge(blog_ratings_avg, self.blog_df, on='blog_id').sort_values(by='avg_rating', ascending=False)
-        return sorted_blogs
+        """Rank every blog by its damped average rating, most popular first.
+
+        Each blog counts ``popularity_prior`` virtual ratings on top of its own, the
+        same formula as Posts.popularity, so a blog with a single 5 does not outrank
+        one with hundreds of 4.5s and unrated blogs sit at the prior mean.
+        """
+        prior_mean, prior_weight = self.popularity_prior
+        counts, sums = self.interactions.column_totals()
+        blog_ids = self.blog_df['blog_id']
+        counts = pd.Series(counts, index=self.interactions.blog_ids).reindex(blog_ids, fill_value=0).to_numpy()
+        sums = pd.Series(sums, index=self.interactions.blog_ids).reindex(blog_ids, fill_value=0.0).to_numpy()
+        ranking = self.blog_df[['blog_id', 'title', 'category__catName']].assign(
+            avg_rating=np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0),
+            popularity=(sums + prior_mean * prior_weight) / (counts + prior_weight),
+        )
+        return ranking.sort_values(by='popularity', ascending=False, kind='stable').reset_index(drop=True)
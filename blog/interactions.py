@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class InteractionMatrix(object):
+    """Users x blogs ratings as a CSR matrix with stable id <-> row/column maps.
+
+    Memory grows with the number of ratings rather than users x blogs. A transposed
+    copy is kept so finding the users who share items with a given user only touches
+    the columns that user has rated.
+    """
+
+    def __init__(self, matrix, user_ids, blog_ids):
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        # A zero rating counts as unrated, as in the dense pivot it replaces
+        self.matrix.eliminate_zeros()
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.blog_ids = np.asarray(blog_ids, dtype=np.int64)
+        self.user_index = {int(user_id): row for row, user_id in enumerate(self.user_ids)}
+        self.blog_index = {int(blog_id): column for column, blog_id in enumerate(self.blog_ids)}
+        self._refresh()
+
+    def _refresh(self):
+        self.item_users = self.matrix.T.tocsr()
+        self.norms = np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=1)).ravel())
+
+    @classmethod
+    def from_ratings(cls, rating_df):
+        """Build from a DataFrame with user_id, blog_id and rating columns; the last duplicate wins."""
+        rating_df = rating_df.drop_duplicates(['user_id', 'blog_id'], keep='last')
+        user_codes, user_ids = pd.factorize(rating_df['user_id'], sort=True)
+        blog_codes, blog_ids = pd.factorize(rating_df['blog_id'], sort=True)
+        matrix = sparse.csr_matrix(
+            (rating_df['rating'].astype(np.float32).to_numpy(), (user_codes, blog_codes)),
+            shape=(len(user_ids), len(blog_ids)),
+        )
+        return cls(matrix, user_ids, blog_ids)
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def to_ratings(self):
+        coo = self.matrix.tocoo()
+        return pd.DataFrame({
+            'user_id': self.user_ids[coo.row],
+            'blog_id': self.blog_ids[coo.col],
+            'rating': coo.data.astype(float),
+        })
+
+    def user_row(self, user_id):
+        return self.user_index.get(int(user_id))
+
+    def blog_column(self, blog_id):
+        return self.blog_index.get(int(blog_id))
+
+    def user_ratings(self, row):
+        """Return ``(columns, ratings)`` of everything the user in ``row`` has rated."""
+        start, stop = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return self.matrix.indices[start:stop], self.matrix.data[start:stop]
+
+    def similar_users(self, row, k):
+        """Top ``k`` users by cosine similarity to ``row``, considering only users who share an item."""
+        columns, ratings = self.user_ratings(row)
+        if len(columns) == 0 or self.norms[row] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        target = sparse.csr_matrix((ratings, columns, [0, len(columns)]), shape=(1, self.matrix.shape[1]))
+        dots = (target @ self.item_users).tocsr()
+        rows, values = dots.indices, dots.data
+        keep = rows != row
+        rows, values = rows[keep], values[keep]
+        similarities = values / (self.norms[rows] * self.norms[row])
+        if len(rows) > k:
+            top = np.argpartition(-similarities, k - 1)[:k]
+            rows, similarities = rows[top], similarities[top]
+        order = np.argsort(-similarities, kind='stable')
+        return rows[order], similarities[order]
+
+    def iter_similar_users(self, k, block_rows=1024):
+        """Yield ``(row, neighbor_rows, similarities)`` with the top ``k`` neighbors of every user.
+
+        Similarities are computed as a sparse product one block of users at a time,
+        so only pairs of users that share an item are ever materialized.
+        """
+        inverse_norms = np.divide(1.0, self.norms, out=np.zeros_like(self.norms), where=self.norms > 0)
+        normalized = sparse.diags(inverse_norms) @ self.matrix
+        normalized_t = normalized.T.tocsr()
+        n_users = self.matrix.shape[0]
+        for start in range(0, n_users, block_rows):
+            block = (normalized[start:start + block_rows] @ normalized_t).tocsr()
+            for offset in range(block.shape[0]):
+                row = start + offset
+                begin, end = block.indptr[offset], block.indptr[offset + 1]
+                rows, similarities = block.indices[begin:end], block.data[begin:end]
+                keep = (rows != row) & (similarities > 0)
+                rows, similarities = rows[keep], similarities[keep]
+                if len(rows) > k:
+                    top = np.argpartition(-similarities, k - 1)[:k]
+                    rows, similarities = rows[top], similarities[top]
+                order = np.argsort(-similarities, kind='stable')
+                yield row, rows[order], similarities[order]
+
+    def column_totals(self):
+        """Return the number and the sum of ratings of every column."""
+        return np.diff(self.item_users.indptr), np.asarray(self.matrix.sum(axis=0)).ravel()
+
+    def column_averages(self):
+        """Return ``(columns, average rating)`` for every blog with at least one rating."""
+        counts, sums = self.column_totals()
+        columns = np.flatnonzero(counts)
+        return columns, sums[columns] / counts[columns]
+
+    def copy(self):
+        return InteractionMatrix(self.matrix.copy(), self.user_ids, self.blog_ids)
+
+    def drop_blog(self, blog_id):
+        """Remove every rating of ``blog_id``; the column stays so ids keep their positions."""
+        column = self.blog_column(blog_id)
+        if column is None:
+            return
+        self.matrix.data[self.matrix.indices == column] = 0
+        self.matrix.eliminate_zeros()
+        self._refresh()
+
+    def save(self, path):
+        np.savez(path, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                 shape=np.asarray(self.matrix.shape), user_ids=self.user_ids, blog_ids=self.blog_ids)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+        return cls(matrix, data['user_ids'], data['blog_ids'])
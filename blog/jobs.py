@@ -0,0 +1,155 @@
+"""Database-backed job queue for background model rebuilds.
+
+Jobs are RecommenderJob rows, so no broker is needed; `manage.py
+run_recommender_worker` claims and runs them. A partial unique constraint
+allows one pending job per kind, and enqueue() folds further requests into it,
+so a burst of triggers costs a single rebuild. Claiming is a compare-and-set
+UPDATE from pending to running, which also works on databases without
+SELECT ... FOR UPDATE SKIP LOCKED.
+
+The worker enqueues a rebuild itself when the published model is missing or
+has fallen behind: RECOMMENDER_REBUILD_AFTER_INTERACTIONS ratings created since
+it was fitted, or RECOMMENDER_REBUILD_AFTER_UPDATES post edits in its update
+log. Requests never fit a model; they keep serving the current version until
+the worker publishes the next one.
+"""
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Interaction, RecommenderJob
+from . import model_store
+
+import logging
+logger = logging.getLogger('django')
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(kind=RecommenderJob.REBUILD, reason=''):
+    """Queue a job of ``kind`` unless one is already pending; returns ``(job, created)``."""
+    for _ in range(2):
+        pending = RecommenderJob.objects.filter(kind=kind, status=RecommenderJob.PENDING)
+        if pending.update(requests=F('requests') + 1):
+            return pending.first(), False
+        try:
+            with transaction.atomic():
+                return RecommenderJob.objects.create(kind=kind, reason=reason), True
+        except IntegrityError:
+            # Another process queued it between the update and the insert
+            continue
+    return RecommenderJob.objects.filter(kind=kind, status=RecommenderJob.PENDING).first(), False
+
+
+def rebuild_reason():
+    """Why the published model should be rebuilt, or None if it is fresh enough."""
+    version = model_store.current_version()
+    if version is None:
+        return 'no model published'
+    manifest = model_store.read_manifest(version)
+    if manifest is None:
+        return f'model {version} is missing'
+
+    max_interaction_id = manifest.get('max_interaction_id')
+    if max_interaction_id is not None:
+        new_ratings = Interaction.objects.filter(id__gt=max_interaction_id).count()
+        if new_ratings >= settings.RECOMMENDER_REBUILD_AFTER_INTERACTIONS:
+            return f'{new_ratings} new ratings since model {version}'
+    post_updates = model_store.pending_update_count(version)
+    if post_updates >= settings.RECOMMENDER_REBUILD_AFTER_UPDATES:
+        return f'{post_updates} post edits since model {version}'
+    return None
+
+
+def enqueue_if_stale():
+    """Queue a rebuild if rebuild_reason() finds one; returns the job or None."""
+    reason = rebuild_reason()
+    if reason is None:
+        return None
+    job, _ = enqueue(RecommenderJob.REBUILD, reason)
+    return job
+
+
+def requeue_stale_jobs(max_age):
+    """Put jobs left running for longer than ``max_age`` seconds, e.g. by a killed worker, back in the queue."""
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = RecommenderJob.objects.filter(status=RecommenderJob.RUNNING, started_at__lt=cutoff)
+    requeued = 0
+    for job in stale:
+        # A pending job of the same kind already covers it
+        if RecommenderJob.objects.filter(kind=job.kind, status=RecommenderJob.PENDING).exists():
+            RecommenderJob.objects.filter(pk=job.pk).update(
+                status=RecommenderJob.FAILED, finished_at=timezone.now(), error='Abandoned by its worker.',
+            )
+        else:
+            try:
+                with transaction.atomic():
+                    RecommenderJob.objects.filter(pk=job.pk, status=RecommenderJob.RUNNING).update(
+                        status=RecommenderJob.PENDING, started_at=None, worker='',
+                    )
+            except IntegrityError:
+                continue
+            requeued += 1
+    return requeued
+
+
+def claim_next(worker=None):
+    """Mark the oldest pending job as running for ``worker`` and return it, or None if the queue is empty."""
+    worker = worker or worker_name()
+    while True:
+        job = RecommenderJob.objects.filter(status=RecommenderJob.PENDING).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        claimed = RecommenderJob.objects.filter(pk=job.pk, status=RecommenderJob.PENDING).update(
+            status=RecommenderJob.RUNNING, started_at=timezone.now(), worker=worker,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Another worker claimed it first
+
+
+def rebuild_model(n_jobs=1, keep=3, precompute=False, publish=True):
+    """Fit and save a new model version, publish it unless ``publish`` is False, and return the version.
+
+    Both `manage.py build_recommender` and the worker's rebuild jobs go through here.
+    """
+    from .user_neighbors import rebuild_user_neighbor_table
+    from .snapshots import precompute_snapshots
+
+    recommender = model_store.build_model(n_jobs=n_jobs)
+    version = model_store.save_model(recommender, publish=publish)
+    if publish:
+        # The table backs the live feed, so it only follows published models
+        rebuild_user_neighbor_table(recommender.interactions, user_index=recommender.user_index)
+    for old_version in model_store.prune_versions(keep):
+        logger.info(f'Removed old model version {old_version}.')
+    if precompute:
+        precompute_snapshots(version, jobs=n_jobs)
+    return version
+
+
+def run_job(job, n_jobs=1, keep=3, precompute=False):
+    """Run a claimed job and record its outcome; failures are stored on the job, not raised."""
+    try:
+        if job.kind != RecommenderJob.REBUILD:
+            raise ValueError(f"Unknown job kind '{job.kind}'.")
+        version = rebuild_model(n_jobs=n_jobs, keep=keep, precompute=precompute)
+    except Exception:
+        logger.exception(f'Recommender job {job.pk} failed.')
+        job.status = RecommenderJob.FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = RecommenderJob.DONE
+        job.model_version = version
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'model_version', 'finished_at'])
+    return job
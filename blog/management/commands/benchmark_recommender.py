@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from blog.benchmark import SCALES, run_benchmark, environment
+
+class Command(BaseCommand):
+    help = 'Time each stage of the hybrid recommender on seeded synthetic data and write the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', choices=sorted(SCALES),
+                            help='Preset size to run; may be repeated (default: small).')
+        parser.add_argument('--posts', type=int, help='Custom number of posts (overrides --scale).')
+        parser.add_argument('--users', type=int, default=None, help='Custom number of users.')
+        parser.add_argument('--ratings', type=int, default=None, help='Custom number of ratings.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data generator.')
+        parser.add_argument('--jobs', type=int, default=1, help='Processes used to preprocess post content (0 = all cores).')
+        parser.add_argument('--factorization', choices=['svd', 'als'], default='svd',
+                            help='Factorization backend timed alongside user kNN.')
+        parser.add_argument('--sample-users', type=int, default=200, help='Users whose recommendations are timed.')
+        parser.add_argument('--output', default=None, help='JSON results file (default: benchmark-<timestamp>.json).')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['posts']:
+            if not kwargs['users'] or not kwargs['ratings']:
+                raise CommandError('--posts needs --users and --ratings.')
+            runs = [('custom', {'posts': kwargs['posts'], 'users': kwargs['users'], 'ratings': kwargs['ratings']})]
+        else:
+            runs = [(name, SCALES[name]) for name in kwargs['scale'] or ['small']]
+
+        created = datetime.now()
+        results = []
+        for name, size in runs:
+            self.stdout.write(f"Benchmarking {name}: {size['posts']} posts, {size['users']} users, {size['ratings']} ratings...")
+            result = run_benchmark(name, size['posts'], size['users'], size['ratings'], seed=kwargs['seed'],
+                                   n_jobs=kwargs['jobs'], sample_users=kwargs['sample_users'],
+                                   factorization=kwargs['factorization'])
+            for stage in result['stages']:
+                latency = f", p95 {stage['p95_ms']:.2f}ms/call" if 'p95_ms' in stage else ''
+                self.stdout.write(f"  {stage['stage']:<30} {stage['seconds']:9.3f}s  peak RSS {stage['peak_rss_mb'] or 0:8.1f} MiB{latency}")
+            results.append(result)
+
+        output = kwargs['output'] or f"benchmark-{created.strftime('%Y%m%d%H%M%S')}.json"
+        with open(output, 'w') as f:
+            json.dump({'created': created.isoformat(), 'environment': environment(), 'runs': results}, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Benchmark results written to {output}.'))
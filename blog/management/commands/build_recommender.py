@@ -0,0 +1,42 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from blog.jobs import enqueue, rebuild_model
+from blog.models import RecommenderJob
+from blog.model_store import model_root, current_version, pending_update_count, read_manifest
+
+class Command(BaseCommand):
+    help = 'Fit the hybrid recommender on the current database and publish it as a new model version.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=3, help='Number of model versions to keep on disk.')
+        parser.add_argument('--jobs', type=int, default=1, help='Processes used to preprocess post content (0 = all cores).')
+        parser.add_argument('--if-stale', action='store_true',
+                            help='Only rebuild when the current model has absorbed RECOMMENDER_REBUILD_AFTER_UPDATES incremental post updates.')
+        parser.add_argument('--no-publish', action='store_true', help='Write the model without making it current.')
+        parser.add_argument('--queue', action='store_true',
+                            help='Queue the rebuild for `manage.py run_recommender_worker` instead of fitting here.')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['queue']:
+            job, created = enqueue(RecommenderJob.REBUILD, 'requested with build_recommender --queue')
+            self.stdout.write(self.style.SUCCESS(
+                f"Queued rebuild job {job.pk}." if created else f"A rebuild is already queued (job {job.pk})."
+            ))
+            return
+
+        version = current_version()
+        if kwargs['if_stale'] and version is not None:
+            pending = pending_update_count(version)
+            if pending < settings.RECOMMENDER_REBUILD_AFTER_UPDATES:
+                self.stdout.write(f"Model {version} has {pending} incremental updates; no rebuild needed.")
+                return
+
+        start = time.perf_counter()
+        version = rebuild_model(n_jobs=kwargs['jobs'], keep=kwargs['keep'], publish=not kwargs['no_publish'])
+        manifest = read_manifest(version)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built recommender model {version} in {model_root()} "
+            f"({manifest['n_blogs']} posts, {manifest['n_ratings']} ratings, built in {time.perf_counter() - start:.1f}s)."
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from blog.text_processing import REQUIRED_CORPORA, missing_corpora, nltk_data_dir
+
+class Command(BaseCommand):
+    help = 'Check that the NLTK corpora used by the recommender are installed locally, optionally downloading the missing ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--download', action='store_true',
+                            help='Download missing corpora into RECOMMENDER_NLTK_DATA.')
+
+    def handle(self, *args, **kwargs):
+        import nltk
+
+        missing = missing_corpora()
+        if missing and kwargs['download']:
+            target = nltk_data_dir()
+            if not target:
+                raise CommandError('RECOMMENDER_NLTK_DATA is not set; nowhere to download to.')
+            for package in missing:
+                self.stdout.write(f"Downloading {package} to {target}...")
+                if not nltk.download(package, download_dir=str(target), quiet=True):
+                    raise CommandError(f"Could not download NLTK package '{package}'.")
+            missing = missing_corpora()
+
+        for _, package in REQUIRED_CORPORA:
+            self.stdout.write(f"  {package:<12} {'missing' if package in missing else 'ok'}")
+        if missing:
+            raise CommandError(
+                f"Missing NLTK corpora: {', '.join(missing)}. Searched: {', '.join(nltk.data.path)}. "
+                f"Run `manage.py check_nltk_data --download` or install them into RECOMMENDER_NLTK_DATA."
+            )
+        self.stdout.write(self.style.SUCCESS('All NLTK corpora used by the recommender are installed.'))
@@ -0,0 +1,57 @@
+import json
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from blog.ann import RandomProjectionLSH, recall_report
+from blog.model_store import load_model, current_version
+
+class Command(BaseCommand):
+    help = 'Compare the recall and latency of LSH user-neighbor indexes against exact search on a model version.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-version', default=None, help='Model version to evaluate (default: the current one).')
+        parser.add_argument('--tables', type=int, nargs='+', default=[settings.RECOMMENDER_LSH_TABLES],
+                            help='Numbers of hash tables to try.')
+        parser.add_argument('--bits', type=int, nargs='+', default=[settings.RECOMMENDER_LSH_BITS],
+                            help='Bits per table to try.')
+        parser.add_argument('--max-candidates', type=int, default=settings.RECOMMENDER_LSH_MAX_CANDIDATES,
+                            help='Candidates re-ranked per query.')
+        parser.add_argument('--k', type=int, default=5, help='Neighbors per query.')
+        parser.add_argument('--sample', type=int, default=1000, help='Users queried.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='Also write the report to this JSON file.')
+
+    def handle(self, *args, **kwargs):
+        version = kwargs['model_version'] or current_version()
+        recommender = load_model(version) if version else None
+        if recommender is None:
+            raise CommandError('No recommender model available; run `manage.py build_recommender` first.')
+        interactions = recommender.interactions
+
+        rng = np.random.default_rng(kwargs['seed'])
+        n_users = interactions.shape[0]
+        rows = rng.choice(n_users, size=min(kwargs['sample'], n_users), replace=False)
+
+        results = []
+        self.stdout.write(f"Model {version}: {n_users} users, {interactions.nnz} ratings, recall@{kwargs['k']} over {len(rows)} users")
+        for n_tables in kwargs['tables']:
+            for n_bits in kwargs['bits']:
+                start = time.perf_counter()
+                index = RandomProjectionLSH.build(interactions, n_tables=n_tables, n_bits=n_bits,
+                                                  max_candidates=kwargs['max_candidates'], seed=kwargs['seed'])
+                build_seconds = time.perf_counter() - start
+                report = recall_report(interactions, index, rows, kwargs['k'])
+                report.update({'tables': n_tables, 'bits': n_bits, 'max_candidates': kwargs['max_candidates'],
+                               'build_seconds': build_seconds})
+                results.append(report)
+                recall = f"{report['recall']:.3f}" if report['recall'] is not None else 'n/a'
+                self.stdout.write(
+                    f"  tables={n_tables:<3} bits={n_bits:<3} recall={recall}  "
+                    f"p95 {report['approximate_p95_ms']:.3f}ms (exact {report['exact_p95_ms']:.3f}ms)  build {build_seconds:.1f}s"
+                )
+
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as f:
+                json.dump({'model_version': version, 'results': results}, f, indent=2)
+        self.stdout.write(self.style.SUCCESS('Neighbor index evaluation finished.'))
@@ -1,4 +1,8 @@
+import hashlib
+import json
+import os
 import openpyxl
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from blog.models import Posts, Category
@@ -8,25 +12,42 @@ from tqdm import tqdm
 class Command(BaseCommand):
     help = 'Import posts from an Excel file into the Posts table with custom post IDs and linked authors.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=os.path.join('blog', 'management', 'commands', 'sampled_blogs.xlsx'),
+                            help='Excel workbook to import.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Posts inserted per transaction.')
+        parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint of an interrupted import.')
+
     def handle(self, *args, **kwargs):
         # Path to the Excel file
-        excel_file = 'blog\management\commands\sampled_blogs.xlsx'
+        excel_file = kwargs['file']
+        chunk_size = kwargs['chunk_size']
+        checkpoint_file = self.checkpoint_path(excel_file)
 
-        # Load the workbook and select the active sheet
-        wb = openpyxl.load_workbook(excel_file)
-        sheet = wb.active
+        # Rows already committed by an earlier run of this import
+        rows_done = 0
+        if kwargs['resume'] and os.path.exists(checkpoint_file):
+            with open(checkpoint_file) as f:
+                rows_done = json.load(f)['rows_done']
+            self.stdout.write(f"Resuming after row {rows_done}.")
 
-        # Prepare lists to hold objects for bulk_create
-        posts_to_create = []
+        # Read-only mode streams rows instead of loading the whole workbook
+        wb = openpyxl.load_workbook(excel_file, read_only=True)
+        sheet = wb.active
 
         # Default user in case author_id does not exist
         default_user, created = User.objects.get_or_create(username='SanikaG')
 
-        # Fixed predefined categories (only these categories will be used)
-        fixed_categories = set(Category.objects.values_list('catName', flat=True))
+        # Resolve authors and the fixed predefined categories once instead of per row
+        author_ids = set(User.objects.values_list('id', flat=True))
+        category_ids = dict(Category.objects.values_list('catName', 'id'))
 
-        # Iterate through the rows in the Excel sheet (skip header row)
-        for row in tqdm(sheet.iter_rows(min_row=2, values_only=True)):
+        posts_to_create = []
+        imported = 0
+
+        # Iterate through the rows in the Excel sheet (skip header row and rows already imported)
+        for row in tqdm(sheet.iter_rows(min_row=2 + rows_done, values_only=True), initial=rows_done):
+            rows_done += 1
             blog_id = row[0]  # Custom post ID
             author_id = row[1]  # Author's ID
             blog_title = row[2]  # Post title
@@ -34,35 +55,51 @@ class Command(BaseCommand):
             blog_link = row[4]  # Post URL
             topic = row[6]  # Category topic
 
-            # Fetch the user/author based on author_id, if not found, use default user
-            try:
-                author = User.objects.get(id=author_id)
-            except User.DoesNotExist:
+            # Use the default user if the author does not exist
+            if author_id not in author_ids:
                 self.stdout.write(self.style.WARNING(f"User with id {author_id} not found. Using default user 'SanikaG' for post '{blog_title}'."))
-                author = default_user
+                author_id = default_user.id
 
             # Check if the category is one of the fixed categories
-            if topic in fixed_categories:
-                category = Category.objects.get(catName=topic)
-            else:
+            if topic not in category_ids:
                 # If the category does not exist, log a warning and skip this post
                 self.stdout.write(self.style.WARNING(f"Category '{topic}' not found in the fixed categories list. Skipping post '{blog_title}'."))
                 continue  # Skip this post and move to the next
 
             # Create the post object (we are assigning a custom blog_id)
-            post = Posts(
+            posts_to_create.append(Posts(
                 id=blog_id,  # Custom post ID
                 title=blog_title,
                 content=blog_content,
                 post_url=blog_link,
-                author=author,
-                category=category
-            )
-            posts_to_create.append(post)
+                author_id=author_id,
+                category_id=category_ids[topic],
+            ))
+
+            if len(posts_to_create) >= chunk_size:
+                imported += self.write_chunk(posts_to_create, rows_done, checkpoint_file)
+                posts_to_create = []
+
+        imported += self.write_chunk(posts_to_create, rows_done, checkpoint_file)
+        wb.close()
+        os.remove(checkpoint_file)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported {imported} posts from Excel.'))
+        self.stdout.write('Run rebuild_search_index and build_recommender to index the new posts.')
 
-        # Bulk create the posts (if any)
-        if posts_to_create:
-            with transaction.atomic():  # Ensure atomicity for bulk creation
-                Posts.objects.bulk_create(posts_to_create)
+    def checkpoint_path(self, excel_file):
+        """Checkpoint of ``excel_file``'s import under IMPORT_CHECKPOINT_DIR, one per workbook path."""
+        os.makedirs(settings.IMPORT_CHECKPOINT_DIR, exist_ok=True)
+        path_hash = hashlib.sha1(os.path.abspath(excel_file).encode()).hexdigest()[:12]
+        return os.path.join(settings.IMPORT_CHECKPOINT_DIR, f'{os.path.basename(excel_file)}.{path_hash}.checkpoint')
 
-        self.stdout.write(self.style.SUCCESS('Successfully imported posts from Excel.'))
+    def write_chunk(self, posts, rows_done, checkpoint_file):
+        """Insert one chunk atomically, then record how far the import got."""
+        if posts:
+            # Skip posts whose IDs already exist so a re-run without --resume is harmless
+            with transaction.atomic():
+                Posts.objects.bulk_create(posts, ignore_conflicts=True)
+        with open(f'{checkpoint_file}.tmp', 'w') as f:
+            json.dump({'rows_done': rows_done}, f)
+        os.replace(f'{checkpoint_file}.tmp', checkpoint_file)
+        return len(posts)
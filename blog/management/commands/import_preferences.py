@@ -1,4 +1,6 @@
+import ast
 import csv
+import os
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from blog.models import UserPreference, Category
@@ -8,43 +10,78 @@ from tqdm import tqdm
 class Command(BaseCommand):
     help = 'Load user preferences from a CSV file into the UserPreference table.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=os.path.join('blog', 'management', 'commands', 'Topics-by-user.csv'),
+                            help='CSV file with userId and top_topics columns.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Users written per transaction.')
+
     def handle(self, *args, **kwargs):
         # Path to the CSV file
-        csv_file = 'blog\management\commands\Topics-by-user.csv'
+        csv_file = kwargs['file']
+        chunk_size = kwargs['chunk_size']
+
+        # Fetched once; used for validation and lookups instead of per-row queries
+        user_ids = set(User.objects.values_list('id', flat=True))
+        self.category_ids = dict(Category.objects.values_list('catName', 'id'))
 
-        # Prepare a list for bulk actions
-        preferences_to_create = []
+        # user_id -> topic names for the current chunk
+        chunk = {}
+        imported = 0
 
         # Open and read the CSV file
-        with open(csv_file, 'r') as file:
+        with open(csv_file, 'r', newline='') as file:
             reader = csv.DictReader(file)
 
             # Iterate through each row in the CSV file
             for row in tqdm(reader):
-                user_id = row['userId']
-                top_topics = eval(row['top_topics'])  # Convert string representation of list to actual list
-
-                # Validate user existence
-                try:
-                    user = User.objects.get(id=user_id)
-                except User.DoesNotExist:
+                user_id = int(row['userId'])
+                if user_id not in user_ids:
                     self.stdout.write(self.style.WARNING(f"User with id {user_id} not found. Skipping."))
                     continue
 
-                # Get or create categories based on `top_topics`
-                categories = []
-                for topic in top_topics:
-                    category, created = Category.objects.get_or_create(catName=topic)
-                    categories.append(category)
-
-                # Update or create UserPreference
+                # Parse the list literal without evaluating arbitrary code
                 try:
-                    with transaction.atomic():  # Ensure atomicity for each user
-                        user_preference, created = UserPreference.objects.get_or_create(user=user)
-                        user_preference.preference.set(categories)  # Set the ManyToMany relation
-                        user_preference.save()
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Error processing preferences for user_id {user_id}: {e}"))
+                    top_topics = ast.literal_eval(row['top_topics'])
+                except (ValueError, SyntaxError):
+                    top_topics = None
+                if not isinstance(top_topics, (list, tuple)) or not all(isinstance(topic, str) for topic in top_topics):
+                    self.stdout.write(self.style.WARNING(f"Unreadable top_topics for user_id {user_id}. Skipping."))
                     continue
 
-        self.stdout.write(self.style.SUCCESS('Successfully imported user preferences from CSV.'))
+                chunk[user_id] = top_topics
+                if len(chunk) >= chunk_size:
+                    imported += self.write_chunk(chunk)
+                    chunk = {}
+
+        imported += self.write_chunk(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported preferences of {imported} users from CSV.'))
+
+    def write_chunk(self, chunk):
+        """Replace the preferences of every user in ``chunk`` using a handful of bulk queries."""
+        if not chunk:
+            return 0
+
+        # Create all topics not seen before in one batch
+        missing = {topic for topics in chunk.values() for topic in topics} - self.category_ids.keys()
+        if missing:
+            Category.objects.bulk_create([Category(catName=topic) for topic in missing])
+            self.category_ids.update(Category.objects.filter(catName__in=missing).values_list('catName', 'id'))
+
+        Through = UserPreference.preference.through
+        with transaction.atomic():
+            preference_ids = dict(UserPreference.objects.filter(user_id__in=list(chunk)).values_list('user_id', 'id'))
+            UserPreference.objects.bulk_create(
+                [UserPreference(user_id=user_id) for user_id in chunk if user_id not in preference_ids]
+            )
+            preference_ids = dict(UserPreference.objects.filter(user_id__in=list(chunk)).values_list('user_id', 'id'))
+
+            # Same result as preference.set(categories), without a query per user
+            Through.objects.filter(userpreference_id__in=list(preference_ids.values())).delete()
+            Through.objects.bulk_create(
+                [
+                    Through(userpreference_id=preference_ids[user_id], category_id=self.category_ids[topic])
+                    for user_id, topics in chunk.items() for topic in set(topics)
+                ],
+                ignore_conflicts=True,
+            )
+        return len(chunk)
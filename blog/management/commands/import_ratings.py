@@ -1,54 +1,117 @@
+import csv
+import os
+import time
+from decimal import Decimal, InvalidOperation
 import openpyxl
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from blog.models import Posts, Interaction
+from blog.rating_aggregates import rebuild_rating_aggregates
 from django.db import transaction
 from tqdm import tqdm
 
+
+def parse_id(value):
+    """``value`` as an integer ID, or None if it is not one, so the row is skipped like an unknown ID."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class Command(BaseCommand):
-    help = 'Import interactions from an Excel file into the Interaction table.'
+    help = 'Import interactions from an Excel, CSV or Parquet file into the Interaction table.'
 
-    def handle(self, *args, **kwargs):
-        # Path to the Excel file
-        excel_file = 'blog/management/commands/sampled_ratings.xlsx'
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=os.path.join('blog', 'management', 'commands', 'sampled_ratings.xlsx'),
+                            help='.xlsx, .csv or .parquet file with blog_id, user_id and rating columns, in that order.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Interactions upserted per transaction.')
 
-        # Load the workbook and select the active sheet
-        wb = openpyxl.load_workbook(excel_file)
-        sheet = wb.active
+    def handle(self, *args, **kwargs):
+        # Path to the input file
+        input_file = kwargs['file']
+        chunk_size = kwargs['chunk_size']
 
-        # Prepare a list to hold objects for bulk_create
-        interactions_to_create = []
+        # Validate foreign keys against ID sets fetched once instead of two queries per row
+        user_ids = set(User.objects.values_list('id', flat=True))
+        blog_ids = set(Posts.objects.values_list('id', flat=True))
 
-        # Iterate through the rows in the Excel sheet (skip header row)
-        for row in tqdm(sheet.iter_rows(min_row=2, values_only=True)):
-            blog_id = row[0]  # Blog ID
-            user_id = row[1]  # User ID
-            rating = row[2]  # Rating
+        # Latest rating per (user, blog) in the current chunk
+        chunk = {}
+        imported = 0
+        skipped = 0
+        started = time.perf_counter()
 
-            # Validate foreign keys
+        for row_number, (blog_id, user_id, rating) in enumerate(tqdm(self.read_rows(input_file)), start=2):
+            if user_id not in user_ids or blog_id not in blog_ids:
+                skipped += 1
+                continue
             try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                self.stdout.write(self.style.WARNING(f"User with id {user_id} not found. Skipping interaction for blog_id {blog_id}."))
-                continue  # Skip this interaction
+                rating = Decimal(str(rating)).quantize(Decimal('0.1'))
+            except InvalidOperation:
+                rating = None
+            # NaN (an empty float cell) quantizes fine but cannot be compared
+            if rating is None or not rating.is_finite() or not 0 <= rating <= 5:
+                self.stdout.write(self.style.WARNING(f"Invalid rating on row {row_number}. Skipping interaction."))
+                skipped += 1
+                continue
 
-            try:
-                blog = Posts.objects.get(id=blog_id)
-            except Posts.DoesNotExist:
-                self.stdout.write(self.style.WARNING(f"Blog with id {blog_id} not found. Skipping interaction for user_id {user_id}."))
-                continue  # Skip this interaction
-
-            # Create the Interaction object using correct field names
-            interaction = Interaction(
-                user_id=user,  # Correct field name in the model
-                blog_id=blog,  # Correct field name in the model
-                rating=rating
-            )
-            interactions_to_create.append(interaction)
+            chunk[(user_id, blog_id)] = rating
+            if len(chunk) >= chunk_size:
+                imported += self.write_chunk(chunk)
+                chunk = {}
 
-        # Bulk create the interactions (if any)
-        if interactions_to_create:
-            with transaction.atomic():  # Ensure atomicity for bulk creation
-                Interaction.objects.bulk_create(interactions_to_create)
+        imported += self.write_chunk(chunk)
+        elapsed = time.perf_counter() - started
 
-        self.stdout.write(self.style.SUCCESS('Successfully imported interactions from Excel.'))
+        # bulk_create skips Posts.record_rating, so bring the denormalized averages back in line
+        with transaction.atomic():
+            rebuild_rating_aggregates(Posts, Interaction)
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} rows with an unknown user, unknown blog or invalid rating."))
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully imported {imported} interactions in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} rows/s).'
+        ))
+
+    def read_rows(self, path):
+        """Yield ``(blog_id, user_id, rating)`` tuples from the file without loading it whole."""
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            with open(path, newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)  # Skip header row
+                for row in reader:
+                    # Short rows are padded so they are counted as skipped rather than raising
+                    row = row + [None] * (3 - len(row))
+                    yield parse_id(row[0]), parse_id(row[1]), row[2]
+        elif extension == '.parquet':
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise CommandError('Reading Parquet files requires pyarrow.')
+            for batch in pq.ParquetFile(path).iter_batches():
+                columns = [batch.column(i).to_pylist() for i in range(3)]
+                yield from zip(*columns)
+        elif extension in ('.xlsx', '.xlsm'):
+            wb = openpyxl.load_workbook(path, read_only=True)
+            try:
+                # Skip header row
+                for row in wb.active.iter_rows(min_row=2, values_only=True):
+                    yield row[0], row[1], row[2]
+            finally:
+                wb.close()
+        else:
+            raise CommandError(f"Unsupported file type '{extension}'; expected .xlsx, .csv or .parquet.")
+
+    def write_chunk(self, chunk):
+        """Insert new interactions and overwrite the rating of existing (user, blog) pairs."""
+        if not chunk:
+            return 0
+        interactions = [Interaction(user_id_id=user_id, blog_id_id=blog_id, rating=rating)
+                        for (user_id, blog_id), rating in chunk.items()]
+        with transaction.atomic():
+            Interaction.objects.bulk_create(
+                interactions, update_conflicts=True, unique_fields=['user_id', 'blog_id'], update_fields=['rating'],
+            )
+        return len(interactions)
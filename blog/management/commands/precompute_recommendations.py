@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from blog.snapshots import precompute_snapshots
+
+class Command(BaseCommand):
+    help = 'Compute the top-N recommendations of every active user and store them as the served snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-version', help='Model version to use (defaults to the current model).')
+        parser.add_argument('--jobs', type=int, default=0, help='Worker processes (0 = all cores).')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users scored per worker task.')
+        parser.add_argument('--top-n', type=int, default=20, help='Recommendations stored per user.')
+
+    def handle(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            version, user_count, row_count = precompute_snapshots(
+                version=kwargs['model_version'],
+                jobs=kwargs['jobs'],
+                chunk_size=kwargs['chunk_size'],
+                top_n=kwargs['top_n'],
+                log=lambda message: self.stdout.write(message),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {row_count} recommendations for {user_count} users from model {version} "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
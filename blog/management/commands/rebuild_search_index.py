@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.search import get_search_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the post search index (SQLite FTS5 table or the SearchPosting fallback) from the Posts table.'
+
+    def handle(self, *args, **kwargs):
+        index = get_search_index()
+        with transaction.atomic():
+            index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index using {type(index).__name__}.'))
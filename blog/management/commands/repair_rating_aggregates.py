@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.models import Posts, Interaction
+from blog.rating_aggregates import rebuild_rating_aggregates
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized rating count, sum and average of every post from the Interaction table.'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            stale = rebuild_rating_aggregates(Posts, Interaction)
+        self.stdout.write(self.style.SUCCESS(f'Rating aggregates rebuilt; {stale} posts were out of date.'))
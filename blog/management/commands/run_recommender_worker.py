@@ -0,0 +1,60 @@
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from blog.jobs import claim_next, enqueue_if_stale, requeue_stale_jobs, run_job, worker_name
+
+class Command(BaseCommand):
+    help = 'Run queued recommender jobs, queueing a model rebuild whenever enough ratings or post edits have piled up.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=settings.RECOMMENDER_WORKER_POLL_SECONDS,
+                            help='Seconds to sleep when there is nothing to do.')
+        parser.add_argument('--once', action='store_true', help='Run the jobs queued right now and exit.')
+        parser.add_argument('--no-triggers', action='store_true',
+                            help='Only run queued jobs; never queue rebuilds from new ratings or post edits.')
+        parser.add_argument('--jobs', type=int, default=1, help='Processes used to fit the model (0 = all cores).')
+        parser.add_argument('--keep', type=int, default=3, help='Number of model versions to keep on disk.')
+        parser.add_argument('--precompute', action='store_true',
+                            help='Also precompute recommendation snapshots for each new model.')
+
+    def handle(self, *args, **kwargs):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        worker = worker_name()
+        requeued = requeue_stale_jobs(settings.RECOMMENDER_JOB_STALE_AFTER)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned jobs.")
+        self.stdout.write(f"Recommender worker {worker} started.")
+
+        try:
+            while not self.stopping:
+                close_old_connections()
+                if not kwargs['no_triggers']:
+                    job = enqueue_if_stale()
+                    if job is not None and job.requests == 1:
+                        self.stdout.write(f"Queued {job.kind} job {job.pk}: {job.reason}.")
+                job = claim_next(worker)
+                if job is None:
+                    if kwargs['once']:
+                        break
+                    time.sleep(kwargs['poll'])
+                    continue
+
+                self.stdout.write(f"Running {job.kind} job {job.pk} ({job.reason}, {job.requests} requests)...")
+                start = time.perf_counter()
+                job = run_job(job, n_jobs=kwargs['jobs'], keep=kwargs['keep'], precompute=kwargs['precompute'])
+                if job.status == job.DONE:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Job {job.pk} published model {job.model_version} in {time.perf_counter() - start:.1f}s."
+                    ))
+                else:
+                    self.stderr.write(f"Job {job.pk} failed:\n{job.error}")
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Recommender worker {worker} stopped.")
+
+    def stop(self, signum, frame):
+        # Finish the current job, then exit
+        self.stopping = True
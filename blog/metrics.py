@@ -0,0 +1,153 @@
+"""Per-stage timing and query counting for the recommendation path.
+
+Wrap a stage in ``with stage('name'):`` to record its wall time and the number
+of database queries it ran into per-process histograms. Each stage is also
+logged as a JSON line. MetricsView exposes the histograms in the Prometheus
+text format. When settings.RECOMMENDER_METRICS_ENABLED is off, stage() returns
+a shared no-op context manager, so instrumented code pays one settings lookup.
+
+Queries are counted on the entering thread's connection, so a stage whose work
+runs on other threads (the async feed) passes ``count_queries=False`` and only
+records its wall time; the stages nested inside it count their own queries.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+import logging
+logger = logging.getLogger('django')
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+_DISABLED = nullcontext()
+
+
+def metrics_enabled():
+    try:
+        return settings.RECOMMENDER_METRICS_ENABLED
+    except (AttributeError, ImproperlyConfigured):
+        # Settings-free use, e.g. the recommender in a notebook
+        return False
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """``(upper bound, observations <= bound)`` pairs, ending with ``+Inf``."""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.seconds = {}
+        self.queries = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, queries=None):
+        with self._lock:
+            if name not in self.seconds:
+                self.seconds[name] = Histogram(SECONDS_BUCKETS)
+                self.queries[name] = Histogram(QUERY_BUCKETS)
+            self.seconds[name].observe(seconds)
+            if queries is not None:
+                self.queries[name].observe(queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    'count': self.seconds[name].count,
+                    'seconds_sum': self.seconds[name].sum,
+                    'queries_sum': self.queries[name].sum,
+                    'seconds_buckets': [[str(bound), count] for bound, count in self.seconds[name].cumulative()],
+                    'queries_buckets': [[str(bound), count] for bound, count in self.queries[name].cumulative()],
+                }
+                for name in sorted(self.seconds)
+            }
+
+    def render_prometheus(self, counters=None):
+        """Prometheus text exposition of every histogram plus any ``counters`` ``{name: value}``."""
+        lines = []
+        with self._lock:
+            for metric, histograms, description in (
+                ('blog_stage_seconds', self.seconds, 'Wall time of recommendation stages.'),
+                ('blog_stage_queries', self.queries, 'Database queries run by recommendation stages.'),
+            ):
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} histogram')
+                for name in sorted(histograms):
+                    histogram = histograms[name]
+                    for bound, count in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{metric}_bucket{{stage="{name}",le="{le}"}} {count}')
+                    lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+        for name, value in (counters or {}).items():
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.seconds.clear()
+            self.queries.clear()
+
+
+registry = MetricsRegistry()
+
+
+class Stage(object):
+
+    def __init__(self, name, count_queries=True):
+        self.name = name
+        self.count_queries = count_queries
+        self.queries = 0 if count_queries else None
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self._count_query) if self.count_queries else nullcontext()
+        self._wrapper.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        registry.observe(self.name, seconds, self.queries)
+        logger.info(json.dumps({
+            'event': 'recommender_stage', 'stage': self.name, 'seconds': round(seconds, 6),
+            'queries': self.queries, 'error': exc_type.__name__ if exc_type else None,
+        }))
+        return False
+
+
+def stage(name, count_queries=True):
+    """Context manager timing ``name``; a no-op unless metrics are enabled."""
+    if not metrics_enabled():
+        return _DISABLED
+    return Stage(name, count_queries)
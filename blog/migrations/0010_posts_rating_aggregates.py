@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:49
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, OuterRef, Subquery, Value, Case, When, FloatField, DecimalField, IntegerField
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    # Frozen here rather than calling blog.rating_aggregates, which later migrations' fields extend
+    Posts = apps.get_model('blog', 'Posts')
+    Interaction = apps.get_model('blog', 'Interaction')
+    ratings = Interaction.objects.filter(blog_id=OuterRef('pk')).order_by().values('blog_id')
+    Posts.objects.update(
+        rating_count=Coalesce(Subquery(ratings.annotate(c=Count('id')).values('c')), Value(0), output_field=IntegerField()),
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(s=Sum('rating')).values('s')), Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=1),
+        ),
+    )
+    Posts.objects.update(avg_rating=Case(
+        When(rating_count__gt=0, then=Cast('rating_sum', FloatField()) / Cast('rating_count', FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_recommendationsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posts',
+            name='avg_rating',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:50
+
+import re
+from collections import Counter
+from django.db import migrations, models, OperationalError
+import django.db.models.deletion
+
+# Frozen copies of blog.search at the time of this migration
+FTS_TABLE = 'blog_posts_fts'
+TOKEN_RE = re.compile(r'\w+')
+FIELD_WEIGHTS = {'title': 3.0, 'author': 1.0, 'category': 2.0}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def create_fts_table(connection):
+    """Create the FTS5 table if this is an SQLite build that supports it; returns whether it exists."""
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(title, author, category, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        return True
+    except OperationalError:
+        return False
+
+
+def build_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if create_fts_table(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, author, category) "
+                f"SELECT p.id, p.title, u.username, c.catName FROM blog_posts p "
+                f"JOIN auth_user u ON u.id = p.author_id JOIN blog_category c ON c.id = p.category_id"
+            )
+        return
+
+    Posts = apps.get_model('blog', 'Posts')
+    SearchPosting = apps.get_model('blog', 'SearchPosting')
+    postings = []
+    for post in Posts.objects.select_related('author', 'category').iterator():
+        fields = {'title': post.title, 'author': post.author.username, 'category': post.category.catName}
+        for field, text in fields.items():
+            postings.extend(
+                SearchPosting(term=term[:64], post_id=post.pk, weight=FIELD_WEIGHTS[field] * count)
+                for term, count in Counter(tokenize(text)).items()
+            )
+    SearchPosting.objects.bulk_create(postings, batch_size=5000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_posts_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=64)),
+                ('weight', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.posts')),
+            ],
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
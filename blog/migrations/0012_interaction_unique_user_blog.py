@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:53
+
+from django.db import migrations, models
+from django.db.models import Max, Count, Sum, OuterRef, Subquery, Value, Case, When, FloatField, DecimalField, IntegerField
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    # Frozen here rather than calling blog.rating_aggregates, which later migrations' fields extend
+    Posts = apps.get_model('blog', 'Posts')
+    Interaction = apps.get_model('blog', 'Interaction')
+    ratings = Interaction.objects.filter(blog_id=OuterRef('pk')).order_by().values('blog_id')
+    Posts.objects.update(
+        rating_count=Coalesce(Subquery(ratings.annotate(c=Count('id')).values('c')), Value(0), output_field=IntegerField()),
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(s=Sum('rating')).values('s')), Value(0),
+            output_field=DecimalField(max_digits=12, decimal_places=1),
+        ),
+    )
+    Posts.objects.update(avg_rating=Case(
+        When(rating_count__gt=0, then=Cast('rating_sum', FloatField()) / Cast('rating_count', FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+
+
+def remove_duplicate_interactions(apps, schema_editor):
+    # Re-run imports left several rows per (user, blog); keep the newest one
+    Interaction = apps.get_model('blog', 'Interaction')
+    latest = (Interaction.objects.order_by().values('user_id', 'blog_id')
+              .annotate(latest_id=Max('id')).values('latest_id'))
+    removed, _ = Interaction.objects.exclude(id__in=latest).delete()
+    if removed:
+        backfill_rating_aggregates(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_interactions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='interaction',
+            constraint=models.UniqueConstraint(fields=('user_id', 'blog_id'), name='unique_user_blog_interaction'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:20
+
+import blog.rating_aggregates
+from django.db import migrations, models
+from django.db.models import F, Value, FloatField
+from django.db.models.functions import Cast
+
+
+# Prior of the damped average when this migration was written, frozen like the backfills in 0010/0012
+PRIOR_MEAN = 3.0
+PRIOR_WEIGHT = 5.0
+
+
+def backfill_popularity(apps, schema_editor):
+    # rating_count/rating_sum are already correct
+    prior_mean, prior_weight = PRIOR_MEAN, PRIOR_WEIGHT
+    apps.get_model('blog', 'Posts').objects.update(popularity=(
+        Cast(F('rating_sum'), FloatField()) + Value(prior_mean * prior_weight)
+    ) / (Cast(F('rating_count'), FloatField()) + Value(prior_weight)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_interaction_unique_user_blog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posts',
+            name='popularity',
+            field=models.FloatField(default=blog.rating_aggregates.default_popularity),
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(fields=['-popularity', '-date_posted'], name='blog_posts_popularity_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:27
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_posts_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('rebuild', 'Rebuild model')], default='rebuild', max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('requests', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('model_version', models.CharField(blank=True, max_length=32)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='blog_recomm_status_0d32dd_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recommenderjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('kind',), name='one_pending_job_per_kind'),
+        ),
+    ]
@@ -0,0 +1,403 @@
+"""Build, persist and load fitted HybridRecommender models.
+
+Each model is written to RECOMMENDER_MODEL_DIR/<version>/ and published by
+atomically rewriting the CURRENT pointer file, so a reader never sees a
+half-written model.
+
+Post edits made after a model was built are appended to the version's
+updates.jsonl log. Every process replays new log entries onto its loaded model
+before serving, so edits show up without refitting; the next full build
+absorbs them along with any vocabulary drift. Edits logged while that build
+reads the database and fits are copied into the new version's log when it is
+saved, so none are lost to the version switch.
+
+numpy, pandas, scikit-learn and the recommender modules are imported inside the
+functions that fit, save or load a model. Importing this module, as the
+signals and views do, stays cheap, and the ML stack is only loaded once a
+process first serves a recommendation.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Posts, Interaction, UserPreference
+
+import logging
+logger = logging.getLogger('django')
+
+FORMAT_VERSION = 3
+CURRENT_FILE = 'CURRENT'
+# Model version whose RecommendationSnapshot rows are complete and being served
+SNAPSHOT_FILE = 'SNAPSHOT'
+MANIFEST_FILE = 'manifest.json'
+UPDATES_FILE = 'updates.jsonl'
+
+_loaded = {'version': None, 'model': None}
+_load_lock = threading.Lock()
+
+
+def model_root():
+    return Path(settings.RECOMMENDER_MODEL_DIR)
+
+
+def load_training_data():
+    """Load posts, ratings and preferences from the database as DataFrames."""
+    import pandas as pd
+
+    blogData = Posts.objects.values('id', 'title', 'content', 'category__catName', 'author__username')
+    ratingData = Interaction.objects.values('user_id', 'blog_id', 'rating')
+    preferenceData = UserPreference.objects.values('user_id', 'preference')
+
+    blog_df = pd.DataFrame(list(blogData), columns=['id', 'title', 'content', 'category__catName', 'author__username'])
+    blog_df.rename(columns={'id': 'blog_id'}, inplace=True)  # Rename to match expected schema
+
+    rating_df = pd.DataFrame(list(ratingData), columns=['user_id', 'blog_id', 'rating'])
+    preferences_df = pd.DataFrame(list(preferenceData), columns=['user_id', 'preference'])
+    return blog_df, rating_df, preferences_df
+
+
+def build_model(n_jobs=1):
+    """Fit a new HybridRecommender on the current contents of the database."""
+    from .hybridRS import HybridRecommender
+    from .ann import build_user_index
+    from .factorization import fit_factorization
+
+    # Post edits logged from here on may be missing from the data read below; save_model() carries them over
+    base_version = current_version()
+    base_updates_offset = update_log_size(base_version) if base_version else 0
+    # Read first, so ratings added while loading count as new for the next rebuild trigger
+    max_interaction_id = Interaction.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    blog_df, rating_df, preferences_df = load_training_data()
+    popularity_prior = (settings.RECOMMENDER_POPULARITY_PRIOR_MEAN, settings.RECOMMENDER_POPULARITY_PRIOR_WEIGHT)
+    recommender = HybridRecommender(blog_df, rating_df, preferences_df, n_jobs=n_jobs, popularity_prior=popularity_prior)
+    recommender.fusion_weights = dict(settings.RECOMMENDER_FUSION_WEIGHTS)
+    recommender.user_index = build_user_index(recommender.interactions, settings.RECOMMENDER_NEIGHBOR_ENGINE, **lsh_options())
+    backend = settings.RECOMMENDER_COLLABORATIVE_BACKEND
+    if backend != 'knn':
+        recommender.factors = fit_factorization(
+            recommender.interactions, backend, n_factors=settings.RECOMMENDER_FACTORS,
+            iterations=settings.RECOMMENDER_ALS_ITERATIONS, regularization=settings.RECOMMENDER_ALS_REGULARIZATION,
+            n_jobs=n_jobs,
+        )
+        recommender.collaborative_backend = backend
+    recommender.max_interaction_id = max_interaction_id
+    recommender.base_version = base_version
+    recommender.base_updates_offset = base_updates_offset
+    return recommender
+
+
+def lsh_options():
+    return {
+        'n_tables': settings.RECOMMENDER_LSH_TABLES,
+        'n_bits': settings.RECOMMENDER_LSH_BITS,
+        'max_candidates': settings.RECOMMENDER_LSH_MAX_CANDIDATES,
+    }
+
+
+def new_version():
+    return datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+
+def save_model(recommender, version=None, publish=True):
+    """Write ``recommender`` as a new model version and optionally publish it."""
+    import numpy as np
+    from scipy import sparse
+    from .ann import RandomProjectionLSH
+
+    root = model_root()
+    root.mkdir(parents=True, exist_ok=True)
+    version = version or new_version()
+    tmp_dir = Path(tempfile.mkdtemp(prefix='.tmp-', dir=root))
+    try:
+        vocabulary = {term: int(index) for term, index in recommender.tfidf_vectorizer.vocabulary_.items()}
+        with open(tmp_dir / 'vocabulary.json', 'w') as f:
+            json.dump(vocabulary, f)
+        np.save(tmp_dir / 'idf.npy', recommender.tfidf_vectorizer.idf_)
+        sparse.save_npz(tmp_dir / 'tfidf.npz', sparse.csr_matrix(recommender.tfidf_matrix))
+        recommender.content_neighbors.save(tmp_dir / 'content_neighbors.npz')
+        recommender.term_postings.save(tmp_dir / 'term_postings.npz')
+
+        blogs = recommender.blog_df[['blog_id', 'title', 'category__catName']]
+        with open(tmp_dir / 'blogs.json', 'w') as f:
+            json.dump({
+                'blog_id': [int(b) for b in blogs['blog_id']],
+                'title': blogs['title'].tolist(),
+                'category__catName': blogs['category__catName'].tolist(),
+            }, f)
+
+        recommender.interactions.save(tmp_dir / 'interactions.npz')
+        neighbor_engine = recommender.user_index.name if recommender.user_index is not None else 'exact'
+        if isinstance(recommender.user_index, RandomProjectionLSH):
+            recommender.user_index.save(tmp_dir / 'user_index.npz')
+        if recommender.factors is not None:
+            recommender.factors.save(tmp_dir / 'factors.npz')
+
+        popularity = recommender.popularity_df
+        np.savez(
+            tmp_dir / 'popularity.npz',
+            blog_id=popularity['blog_id'].to_numpy(dtype=np.int64),
+            avg_rating=popularity['avg_rating'].to_numpy(dtype=np.float64),
+            popularity=popularity['popularity'].to_numpy(dtype=np.float64),
+        )
+
+        with open(tmp_dir / MANIFEST_FILE, 'w') as f:
+            json.dump({
+                'format_version': FORMAT_VERSION,
+                'version': version,
+                'created_at': datetime.now().isoformat(),
+                'n_blogs': int(len(recommender.blog_df)),
+                'n_users': int(recommender.interactions.shape[0]),
+                'n_ratings': int(recommender.interactions.nnz),
+                'n_terms': len(vocabulary),
+                'content_neighbors': recommender.content_neighbors.k,
+                'neighbor_engine': neighbor_engine,
+                'collaborative_backend': recommender.collaborative_backend,
+                'max_interaction_id': recommender.max_interaction_id,
+            }, f, indent=2)
+        os.rename(tmp_dir, root / version)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    base_version = getattr(recommender, 'base_version', None)
+    if base_version and base_version != version:
+        offset = carry_over_updates(base_version, recommender.base_updates_offset, version)
+        if publish:
+            publish_version(version)
+            # Edits logged by writers that read CURRENT just before the switch
+            carry_over_updates(base_version, offset, version)
+    elif publish:
+        publish_version(version)
+    return version
+
+
+def _write_pointer(name, version):
+    root = model_root()
+    root.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.pointer-', dir=root)
+    with os.fdopen(fd, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, root / name)
+
+
+def _read_pointer(name):
+    try:
+        with open(model_root() / name) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_version(version):
+    """Point CURRENT at ``version``; the rename makes the switch atomic."""
+    _write_pointer(CURRENT_FILE, version)
+
+
+def current_version():
+    return _read_pointer(CURRENT_FILE)
+
+
+def publish_snapshot_version(version):
+    _write_pointer(SNAPSHOT_FILE, version)
+
+
+def snapshot_version():
+    return _read_pointer(SNAPSHOT_FILE)
+
+
+def list_versions():
+    root = model_root()
+    if not root.exists():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+
+
+def prune_versions(keep):
+    """Delete all but the newest ``keep`` versions, never touching the current one."""
+    current = current_version()
+    versions = list_versions()
+    removed = []
+    for version in versions[:max(len(versions) - keep, 0)]:
+        if version != current:
+            shutil.rmtree(model_root() / version, ignore_errors=True)
+            removed.append(version)
+    return removed
+
+
+def read_manifest(version):
+    """The manifest of a saved model version, or None if it is missing."""
+    try:
+        with open(model_root() / version / MANIFEST_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_model(version):
+    """Load a saved model version; returns None if it is missing or incompatible."""
+    import numpy as np
+    import pandas as pd
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from .hybridRS import HybridRecommender
+    from .interactions import InteractionMatrix
+    from .neighbors import ContentNeighborIndex
+    from .term_postings import TermPostings
+    from .ann import RandomProjectionLSH
+    from .factorization import MatrixFactorization
+
+    path = model_root() / version
+    manifest = read_manifest(version)
+    if manifest is None:
+        logger.warning(f"Recommender model {version} not found in {model_root()}.")
+        return None
+    if manifest.get('format_version') != FORMAT_VERSION:
+        logger.warning(f"Recommender model {version} has format {manifest.get('format_version')}, expected {FORMAT_VERSION}.")
+        return None
+
+    with open(path / 'vocabulary.json') as f:
+        vocabulary = json.load(f)
+    tfidf_vectorizer = TfidfVectorizer(vocabulary=vocabulary)
+    tfidf_vectorizer.idf_ = np.load(path / 'idf.npy')
+    tfidf_matrix = sparse.load_npz(path / 'tfidf.npz')
+    content_neighbors = ContentNeighborIndex.load(path / 'content_neighbors.npz')
+
+    with open(path / 'blogs.json') as f:
+        blog_df = pd.DataFrame(json.load(f))
+
+    interactions = InteractionMatrix.load(path / 'interactions.npz')
+
+    popularity = np.load(path / 'popularity.npz')
+    # Versions saved before the damped ranking only have the plain average
+    popularity_df = pd.merge(
+        pd.DataFrame({
+            'blog_id': popularity['blog_id'],
+            'avg_rating': popularity['avg_rating'],
+            'popularity': popularity['popularity'] if 'popularity' in popularity else popularity['avg_rating'],
+        }),
+        blog_df, on='blog_id', how='inner', sort=False,
+    )
+
+    recommender = HybridRecommender.from_fitted(
+        blog_df, interactions, tfidf_vectorizer, tfidf_matrix, content_neighbors, popularity_df
+    )
+    if manifest.get('neighbor_engine') == RandomProjectionLSH.name:
+        recommender.user_index = RandomProjectionLSH.load(path / 'user_index.npz', interactions)
+    if manifest.get('collaborative_backend', 'knn') != 'knn':
+        recommender.factors = MatrixFactorization.load(path / 'factors.npz')
+        recommender.collaborative_backend = manifest['collaborative_backend']
+    # Versions saved before the postings were persisted transpose the matrix on first search
+    if (path / 'term_postings.npz').exists():
+        recommender._term_postings = TermPostings.load(path / 'term_postings.npz')
+    recommender.fusion_weights = dict(settings.RECOMMENDER_FUSION_WEIGHTS)
+    recommender.max_interaction_id = manifest.get('max_interaction_id')
+    recommender.version = version
+    recommender.updates_offset = 0
+    return recommender
+
+
+def record_post_change(blog_id, post=None):
+    """Append an upsert (``post`` given) or delete of ``blog_id`` to the current model's update log."""
+    version = current_version()
+    if version is None:
+        return
+    if post is None:
+        entry = {'op': 'delete', 'blog_id': blog_id}
+    else:
+        entry = {
+            'op': 'upsert',
+            'blog_id': blog_id,
+            'title': post.title,
+            'content': post.content,
+            'category__catName': post.category.catName,
+        }
+    # A single write of one line to a file opened for appending is not interleaved with other writers
+    with open(model_root() / version / UPDATES_FILE, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def update_log_size(version):
+    try:
+        return os.path.getsize(model_root() / version / UPDATES_FILE)
+    except FileNotFoundError:
+        return 0
+
+
+def carry_over_updates(from_version, offset, to_version):
+    """Append the complete entries of ``from_version``'s update log after byte ``offset`` to ``to_version``'s log.
+
+    Returns the offset up to which entries were copied. Replaying an entry twice
+    is harmless, as upserts and deletes are idempotent.
+    """
+    try:
+        with open(model_root() / from_version / UPDATES_FILE, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return offset
+    end = chunk.rfind(b'\n') + 1
+    if end:
+        with open(model_root() / to_version / UPDATES_FILE, 'ab') as f:
+            f.write(chunk[:end])
+    return offset + end
+
+
+def pending_update_count(version):
+    try:
+        with open(model_root() / version / UPDATES_FILE, 'rb') as f:
+            return sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+
+
+def apply_pending_updates(recommender):
+    """Return ``recommender`` with the update log entries written since it last caught up.
+
+    The entries are replayed on a copy, so threads still scoring with
+    ``recommender`` never see a half-applied update; the caller swaps in the
+    returned model. Returns ``recommender`` itself when there is nothing new.
+    """
+    path = model_root() / recommender.version / UPDATES_FILE
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return recommender
+    if size <= recommender.updates_offset:
+        return recommender
+    with open(path, 'rb') as f:
+        f.seek(recommender.updates_offset)
+        chunk = f.read(size - recommender.updates_offset)
+    # Leave a partially written trailing line for the next call
+    end = chunk.rfind(b'\n') + 1
+    if end == 0:
+        return recommender
+    updated = recommender.copy_for_update()
+    for line in chunk[:end].splitlines():
+        entry = json.loads(line)
+        if entry['op'] == 'delete':
+            updated.remove_post(entry['blog_id'])
+        else:
+            updated.upsert_post(entry['blog_id'], entry['title'], entry['content'], entry['category__catName'])
+    updated.updates_offset += end
+    return updated
+
+
+def get_current_model():
+    """Return the published model, loading it once per process and version."""
+    version = current_version()
+    if version is None:
+        return None
+    with _load_lock:
+        if _loaded['version'] != version:
+            _loaded['model'] = load_model(version)
+            _loaded['version'] = version
+        if _loaded['model'] is not None:
+            _loaded['model'] = apply_pending_updates(_loaded['model'])
+        return _loaded['model']
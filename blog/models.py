@@ -3,7 +3,10 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.validators import MaxValueValidator
-from django.db.models import Avg
+from django.db.models import F, Case, When, Value, FloatField
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan
+from .rating_aggregates import default_popularity, popularity_expression
 
 class Category(models.Model):
     catName = models.CharField(max_length=30)
@@ -18,12 +21,43 @@ class Posts(models.Model):
     post_url = models.URLField(null = False)
     author=models.ForeignKey(User, on_delete=models.CASCADE)
     category=models.ForeignKey(Category, on_delete=models.CASCADE, default=1)
+    # Denormalized from Interaction; kept in step by record_rating() and `manage.py repair_rating_aggregates`
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.DecimalField(default=0, max_digits=12, decimal_places=1)
+    avg_rating = models.FloatField(default=0.0)
+    # Damped average rating, maintained by record_rating(); see most_popular()
+    popularity = models.FloatField(default=default_popularity)
+
+    class Meta:
+        indexes = [models.Index(fields=['-popularity', '-date_posted'], name='blog_posts_popularity_idx')]
     
     def __str__(self):
         return self.title
     
     def average_rating(self) -> float:
-        return Interaction.objects.filter(blog_id=self).aggregate(Avg("rating"))["rating__avg"] or 0
+        return self.avg_rating
+
+    @classmethod
+    def record_rating(cls, post_id, rating_delta, count_delta) -> float:
+        """Atomically add a rating change to the post's aggregates and popularity and return the new average."""
+        new_sum = F('rating_sum') + rating_delta
+        new_count = F('rating_count') + count_delta
+        cls.objects.filter(pk=post_id).update(
+            rating_count=new_count,
+            rating_sum=new_sum,
+            avg_rating=Case(
+                When(GreaterThan(new_count, 0), then=Cast(new_sum, FloatField()) / Cast(new_count, FloatField())),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            popularity=popularity_expression(new_sum, new_count),
+        )
+        return cls.objects.filter(pk=post_id).values_list('avg_rating', flat=True).get()
+
+    @classmethod
+    def most_popular(cls, k):
+        """Ids of the ``k`` most popular posts, read in order from the popularity index."""
+        return list(cls.objects.order_by('-popularity', '-date_posted').values_list('id', flat=True)[:k])
     
     def get_absolute_url(self):
         return reverse('post-detail', kwargs={'pk':self.pk})
@@ -38,4 +72,72 @@ class UserPreference(models.Model):
 class Interaction(models.Model):
     user_id = models.ForeignKey(User, on_delete = models.CASCADE)
     blog_id = models.ForeignKey(Posts, on_delete = models.CASCADE)
-    rating = models.DecimalField(default = 0.0, max_digits=2, decimal_places=1, validators=[MaxValueValidator(5.0)])
\ No newline at end of file
+    rating = models.DecimalField(default = 0.0, max_digits=2, decimal_places=1, validators=[MaxValueValidator(5.0)])
+
+    class Meta:
+        # One rating per user and blog; lets bulk imports upsert on the pair
+        constraints = [models.UniqueConstraint(fields=['user_id', 'blog_id'], name='unique_user_blog_interaction')]
+
+class UserNeighbor(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='neighbor_links')
+    neighbor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    similarity = models.FloatField()
+
+    class Meta:
+        unique_together = ('user', 'neighbor')
+        indexes = [models.Index(fields=['user', '-similarity'])]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.neighbor_id} ({self.similarity:.3f})"
+
+class RecommendationSnapshot(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendation_snapshots')
+    rank = models.PositiveSmallIntegerField()
+    blog = models.ForeignKey(Posts, on_delete=models.CASCADE, related_name='snapshots')
+    score = models.FloatField()
+    model_version = models.CharField(max_length=32)
+
+    class Meta:
+        unique_together = ('user', 'model_version', 'rank')
+
+    def __str__(self):
+        return f"{self.user_id} #{self.rank}: {self.blog_id} ({self.model_version})"
+
+class SearchPosting(models.Model):
+    """Inverted-index entry used for search on databases without SQLite FTS5."""
+    TERM_LENGTH = 64
+
+    term = models.CharField(max_length=TERM_LENGTH, db_index=True)
+    post = models.ForeignKey(Posts, on_delete=models.CASCADE, related_name='+')
+    weight = models.FloatField()
+
+    def __str__(self):
+        return f"{self.term} -> {self.post_id}"
+
+class RecommenderJob(models.Model):
+    """Background job run by `manage.py run_recommender_worker`; see blog/jobs.py."""
+    REBUILD = 'rebuild'
+    KIND_CHOICES = [(REBUILD, 'Rebuild model')]
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default=REBUILD)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    reason = models.CharField(max_length=200, blank=True)
+    # Triggers folded into this job while it was pending
+    requests = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    model_version = models.CharField(max_length=32, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        constraints = [
+            models.UniqueConstraint(fields=['kind'], condition=models.Q(status='pending'), name='one_pending_job_per_kind'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
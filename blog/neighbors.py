@@ -0,0 +1,143 @@
+import numpy as np
+from sklearn.preprocessing import normalize
+
+DEFAULT_NEIGHBORS = 50
+DEFAULT_THRESHOLD = 0.2
+# Upper bound on the dense similarity block held in memory while building
+DEFAULT_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+class ContentNeighborIndex(object):
+    """Top-k most similar posts for every post, stored as fixed-width arrays.
+
+    Row ``i`` of ``neighbor_ids`` holds the row numbers of the posts most similar
+    to post ``i`` in descending order of cosine similarity; unused slots are -1.
+    Rows can be added, recomputed or deleted one at a time so a single post edit
+    does not require rebuilding the whole index.
+    """
+
+    def __init__(self, neighbor_ids, neighbor_scores, threshold=DEFAULT_THRESHOLD):
+        self.neighbor_ids = neighbor_ids
+        self.neighbor_scores = neighbor_scores
+        self.threshold = threshold
+
+    @property
+    def k(self):
+        return self.neighbor_ids.shape[1]
+
+    def __len__(self):
+        return self.neighbor_ids.shape[0]
+
+    @classmethod
+    def build(cls, matrix, k=DEFAULT_NEIGHBORS, threshold=DEFAULT_THRESHOLD, max_block_bytes=DEFAULT_BLOCK_BYTES):
+        """Build the index from a document-term matrix, one block of rows at a time.
+
+        Only a ``block_rows x n`` slice of the similarity matrix exists at once, so
+        peak memory is bounded by ``max_block_bytes`` rather than growing with n^2.
+        """
+        matrix = normalize(matrix.astype(np.float32), norm='l2', copy=False).tocsr()
+        n = matrix.shape[0]
+        neighbor_ids = np.full((n, k), -1, dtype=np.int32)
+        neighbor_scores = np.zeros((n, k), dtype=np.float32)
+        k = max(min(k, n - 1), 0)
+        if k == 0:
+            return cls(neighbor_ids, neighbor_scores, threshold)
+
+        matrix_t = matrix.T.tocsc()
+        block_rows = max(1, int(max_block_bytes // (n * 4)))
+        for start in range(0, n, block_rows):
+            stop = min(start + block_rows, n)
+            block = (matrix[start:stop] @ matrix_t).toarray()
+            # A post is not its own neighbor
+            block[np.arange(stop - start), np.arange(start, stop)] = -1.0
+            ids, scores = top_k_rows(block, k)
+            keep = scores > threshold
+            neighbor_ids[start:stop, :k] = np.where(keep, ids, -1)
+            neighbor_scores[start:stop, :k] = np.where(keep, scores, 0.0)
+        return cls(neighbor_ids, neighbor_scores, threshold)
+
+    def neighbors(self, row):
+        """Return ``(rows, scores)`` of the stored neighbors of ``row``."""
+        ids = self.neighbor_ids[row]
+        mask = ids >= 0
+        return ids[mask], self.neighbor_scores[row][mask]
+
+    def copy(self):
+        return ContentNeighborIndex(self.neighbor_ids.copy(), self.neighbor_scores.copy(), self.threshold)
+
+    def append_rows(self, count=1):
+        """Add ``count`` empty rows at the end; fill them with :meth:`update_row`."""
+        self.neighbor_ids = np.vstack([self.neighbor_ids, np.full((count, self.k), -1, dtype=np.int32)])
+        self.neighbor_scores = np.vstack([self.neighbor_scores, np.zeros((count, self.k), dtype=np.float32)])
+
+    def update_row(self, row, similarities):
+        """Recompute the neighbors of ``row`` and the reverse edges that point at it.
+
+        ``similarities`` is the cosine similarity of ``row`` to every row. Only the
+        row itself and the rows that list, or should now list, ``row`` are touched.
+        """
+        similarities = np.asarray(similarities, dtype=np.float32).copy()
+        similarities[row] = -1.0
+        k = min(self.k, len(similarities) - 1)
+        if k > 0:
+            ids, scores = top_k_rows(similarities[np.newaxis, :], k)
+            keep = scores[0] > self.threshold
+            self._set_row(row, ids[0][keep], scores[0][keep])
+
+        candidates = np.flatnonzero(similarities > self.threshold)
+        current = np.flatnonzero((self.neighbor_ids == row).any(axis=1))
+        for other in np.union1d(candidates, current):
+            self._insert(other, row, similarities[other])
+
+    def delete_row(self, row):
+        """Remove ``row``, drop every edge to it and shift later row numbers down by one."""
+        neighbor_ids = np.delete(self.neighbor_ids, row, axis=0)
+        neighbor_scores = np.delete(self.neighbor_scores, row, axis=0)
+        hit = neighbor_ids == row
+        neighbor_ids[neighbor_ids > row] -= 1
+        neighbor_ids[hit] = -1
+        self.neighbor_ids = neighbor_ids
+        self.neighbor_scores = neighbor_scores
+        for other in np.flatnonzero(hit.any(axis=1)):
+            ids, scores = self.neighbors(other)
+            self._set_row(other, ids, scores)
+
+    def _insert(self, target, row, score):
+        if self.k == 0:
+            return
+        ids = self.neighbor_ids[target]
+        scores = self.neighbor_scores[target]
+        listed = row in ids
+        if not listed and (score <= self.threshold or (ids[-1] >= 0 and score <= scores[-1])):
+            return
+        keep = (ids >= 0) & (ids != row)
+        ids, scores = ids[keep], scores[keep]
+        if score > self.threshold:
+            ids = np.append(ids, row)
+            scores = np.append(scores, np.float32(score))
+        order = np.argsort(-scores, kind='stable')[:self.k]
+        self._set_row(target, ids[order], scores[order])
+
+    def _set_row(self, row, ids, scores):
+        count = len(ids)
+        self.neighbor_ids[row] = -1
+        self.neighbor_scores[row] = 0.0
+        self.neighbor_ids[row, :count] = ids
+        self.neighbor_scores[row, :count] = scores
+
+    def save(self, path):
+        np.savez(path, neighbor_ids=self.neighbor_ids, neighbor_scores=self.neighbor_scores,
+                 threshold=np.float32(self.threshold))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['neighbor_ids'], data['neighbor_scores'], float(data['threshold']))
+
+
+def top_k_rows(block, k):
+    """Column indices and values of the ``k`` largest entries of each row, sorted descending."""
+    top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db.models import Count, Sum, Q, F, OuterRef, Subquery, Value, Case, When, FloatField, DecimalField, IntegerField
+from django.db.models.functions import Cast, Coalesce
+
+
+def default_popularity():
+    """Popularity of a post with no ratings: the prior mean."""
+    return float(settings.RECOMMENDER_POPULARITY_PRIOR_MEAN)
+
+
+def popularity_expression(rating_sum, rating_count):
+    """Damped average: the post's ratings plus PRIOR_WEIGHT virtual ratings of PRIOR_MEAN.
+
+    Posts with few ratings stay close to the prior instead of jumping to the top on
+    a single 5. The prior is fixed, so the value can be updated from a post's own
+    count and sum without touching other posts.
+    """
+    prior_mean = float(settings.RECOMMENDER_POPULARITY_PRIOR_MEAN)
+    prior_weight = float(settings.RECOMMENDER_POPULARITY_PRIOR_WEIGHT)
+    return (Cast(rating_sum, FloatField()) + Value(prior_mean * prior_weight)) / (
+        Cast(rating_count, FloatField()) + Value(prior_weight)
+    )
+
+
+def rebuild_rating_aggregates(posts_model, interaction_model):
+    """Recompute rating_count/rating_sum/avg_rating/popularity of every post from its Interaction rows.
+
+    Takes the model classes so data migrations can pass their historical models.
+    Returns the number of posts whose stored aggregates were wrong.
+    """
+    ratings = interaction_model.objects.filter(blog_id=OuterRef('pk')).order_by().values('blog_id')
+    actual_count = Coalesce(Subquery(ratings.annotate(c=Count('id')).values('c')), Value(0), output_field=IntegerField())
+    actual_sum = Coalesce(
+        Subquery(ratings.annotate(s=Sum('rating')).values('s')), Value(0),
+        output_field=DecimalField(max_digits=12, decimal_places=1),
+    )
+
+    stale = posts_model.objects.annotate(actual_count=actual_count, actual_sum=actual_sum).filter(
+        ~Q(rating_count=F('actual_count')) | ~Q(rating_sum=F('actual_sum'))
+    ).count()
+
+    posts_model.objects.update(rating_count=actual_count, rating_sum=actual_sum)
+    posts_model.objects.update(
+        avg_rating=Case(
+            When(rating_count__gt=0, then=Cast('rating_sum', FloatField()) / Cast('rating_count', FloatField())),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        popularity=popularity_expression(F('rating_sum'), F('rating_count')),
+    )
+    return stale
@@ -0,0 +1,63 @@
+"""Per-user cache of recommend_blogs() results.
+
+Entries live in the ``recommendations`` cache alias, so TTL and size-based
+eviction come from its TIMEOUT and MAX_ENTRIES settings and the backend can be
+switched between local memory and files in settings.CACHES. An entry is only
+used if it was computed by the model version being served.
+"""
+import threading
+
+from django.core.cache import caches
+
+CACHE_ALIAS = 'recommendations'
+
+
+class RecommendationCache(object):
+
+    def __init__(self, alias=CACHE_ALIAS):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def key(user_id):
+        return f'recommendations:user:{user_id}'
+
+    def get_or_compute(self, user_id, model_version, compute):
+        """Return the cached recommendations of ``user_id``, calling ``compute()`` on a miss."""
+        entry = self.cache.get(self.key(user_id))
+        if entry is not None and entry[0] == model_version:
+            self._count('hits')
+            return entry[1]
+        self._count('misses')
+        recommendations = compute()
+        self.cache.set(self.key(user_id), (model_version, recommendations))
+        return recommendations
+
+    def invalidate(self, user_id):
+        self.cache.delete(self.key(user_id))
+        self._count('invalidations')
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        """Counters for this process since start-up."""
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.cache).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+recommendation_cache = RecommendationCache()
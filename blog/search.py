@@ -0,0 +1,167 @@
+"""Inverted-index search over post titles, authors and categories.
+
+On SQLite the index is an FTS5 virtual table ranked with bm25(). Other
+databases, or SQLite builds without FTS5, use the SearchPosting table: terms
+are tokenized in Python and results ranked by weighted tf-idf. Both indexes are
+updated from the Posts post_save/post_delete signals, and rebuilt in full by
+`manage.py rebuild_search_index`.
+
+Content search (``?mode=content``) instead ranks posts against the fitted
+recommender's TF-IDF vectors; see HybridRecommender.search().
+"""
+import math
+import re
+from collections import defaultdict
+
+from django.db import connection
+
+from .models import Posts, SearchPosting
+
+FTS_TABLE = 'blog_posts_fts'
+TOKEN_RE = re.compile(r'\w+')
+RESULTS_LIMIT = 100
+# Relative importance of a match in each indexed field
+FIELD_WEIGHTS = {'title': 3.0, 'author': 1.0, 'category': 2.0}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def post_fields(post):
+    return {'title': post.title, 'author': post.author.username, 'category': post.category.catName}
+
+
+def fts5_available(using_connection=None):
+    using_connection = using_connection or connection
+    if using_connection.vendor != 'sqlite':
+        return False
+    with using_connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+class FTS5SearchIndex(object):
+
+    def index_post(self, post):
+        fields = post_fields(post)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, author, category) VALUES (%s, %s, %s, %s)",
+                [post.pk, fields['title'], fields['author'], fields['category']],
+            )
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, author, category) "
+                f"SELECT p.id, p.title, u.username, c.catName FROM blog_posts p "
+                f"JOIN auth_user u ON u.id = p.author_id JOIN blog_category c ON c.id = p.category_id"
+            )
+
+    def search(self, query, limit=RESULTS_LIMIT):
+        """Return ``(post_id, score)`` pairs, best match first."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # Every token must match, as a prefix, in any indexed column
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in ('title', 'author', 'category'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, -bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s ORDER BY score DESC LIMIT %s",
+                [match, limit],
+            )
+            return cursor.fetchall()
+
+
+class PostingsSearchIndex(object):
+    """Portable fallback: one SearchPosting row per (term, post, field)."""
+
+    @staticmethod
+    def postings_for(post):
+        postings = []
+        for field, text in post_fields(post).items():
+            counts = defaultdict(int)
+            for token in tokenize(text):
+                counts[token] += 1
+            postings.extend(
+                SearchPosting(term=term[:SearchPosting.TERM_LENGTH], post_id=post.pk, weight=FIELD_WEIGHTS[field] * count)
+                for term, count in counts.items()
+            )
+        return postings
+
+    def index_post(self, post):
+        SearchPosting.objects.filter(post_id=post.pk).delete()
+        SearchPosting.objects.bulk_create(self.postings_for(post))
+
+    def remove_post(self, post_id):
+        SearchPosting.objects.filter(post_id=post_id).delete()
+
+    def rebuild(self, batch_size=5000):
+        SearchPosting.objects.all().delete()
+        batch = []
+        for post in Posts.objects.select_related('author', 'category').iterator(chunk_size=batch_size):
+            batch.extend(self.postings_for(post))
+            if len(batch) >= batch_size:
+                SearchPosting.objects.bulk_create(batch)
+                batch = []
+        SearchPosting.objects.bulk_create(batch)
+
+    def search(self, query, limit=RESULTS_LIMIT):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        total_posts = max(Posts.objects.count(), 1)
+        scores = None
+        for token in tokens:
+            token_scores = defaultdict(float)
+            postings = list(SearchPosting.objects.filter(term__startswith=token).values_list('term', 'post_id', 'weight'))
+            document_frequency = defaultdict(set)
+            for term, post_id, _ in postings:
+                document_frequency[term].add(post_id)
+            for term, post_id, weight in postings:
+                token_scores[post_id] += weight * math.log(1 + total_posts / len(document_frequency[term]))
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {post_id: score + token_scores[post_id] for post_id, score in scores.items() if post_id in token_scores}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: -item[1])[:limit]
+
+
+_index = None
+
+
+def get_search_index():
+    global _index
+    if _index is None:
+        _index = FTS5SearchIndex() if fts5_available() else PostingsSearchIndex()
+    return _index
+
+
+def search_posts(query, limit=RESULTS_LIMIT):
+    """Matching posts in rank order, ties broken by average rating."""
+    return ranked_posts(get_search_index().search(query, limit))
+
+
+def content_search_posts(recommender, query, limit=RESULTS_LIMIT):
+    """Posts whose content is closest to ``query`` in the recommender's TF-IDF space."""
+    return ranked_posts(recommender.search(query, limit))
+
+
+def ranked_posts(ranked):
+    """Load the posts of ``(post_id, score)`` pairs, keeping their rank order."""
+    if not ranked:
+        return []
+    score_of = dict(ranked)
+    posts = Posts.objects.filter(id__in=score_of).select_related('author__profile', 'category')
+    return sorted(posts, key=lambda post: (-score_of[post.id], -post.avg_rating))
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Category, Posts, UserPreference
+from .model_store import record_post_change
+from .recommendation_cache import recommendation_cache
+from .search import get_search_index
+
+@receiver(post_save, sender=Posts)
+def update_recommender_on_save(sender, instance, **kwargs):
+    transaction.on_commit(lambda: record_post_change(instance.pk, instance))
+
+
+@receiver(post_save, sender=Posts)
+def update_search_index_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_index().index_post(instance)
+
+
+@receiver(post_delete, sender=Posts)
+def update_recommender_on_delete(sender, instance, **kwargs):
+    blog_id = instance.pk
+    transaction.on_commit(lambda: record_post_change(blog_id))
+
+
+@receiver(post_delete, sender=Posts)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    get_search_index().remove_post(instance.pk)
+
+
+def reindex_posts(posts):
+    index = get_search_index()
+    for post in posts.select_related('author', 'category'):
+        index.index_post(post)
+
+
+# Posts are indexed with their author's username and category name, so renames re-index them
+@receiver(post_save, sender=User)
+def update_search_index_on_author_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Logins save only last_login
+    if not (raw or created) and (update_fields is None or 'username' in update_fields):
+        reindex_posts(Posts.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=Category)
+def update_search_index_on_category_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if not (raw or created) and (update_fields is None or 'catName' in update_fields):
+        reindex_posts(Posts.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=UserPreference)
+@receiver(post_delete, sender=UserPreference)
+def invalidate_recommendations_on_preference_change(sender, instance, **kwargs):
+    recommendation_cache.invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=UserPreference.preference.through)
+def invalidate_recommendations_on_preference_set(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, UserPreference):
+        recommendation_cache.invalidate(instance.user_id)
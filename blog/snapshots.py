@@ -0,0 +1,106 @@
+"""Materialized per-user recommendation feeds.
+
+precompute_snapshots() scores every active user against one model version on a
+process pool and bulk-inserts the results as RecommendationSnapshot rows. The
+SNAPSHOT pointer only moves to the new version once all of its rows are written,
+so the feed never mixes two runs.
+
+Snapshots are only served while their version is the published model; once a
+newer model is published the feed falls back to scoring live until the next
+precompute. A user's rows are dropped when they rate a post, so their next feed
+reflects the rating.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Posts, RecommendationSnapshot
+from . import model_store
+
+BATCH_SIZE = 5000
+
+_worker_model = None
+# Live popularity ranking read once per worker; recommend_blogs pads with at most 2 * FEED_SIZE of it
+_worker_popular = []
+
+
+def active_user_ids(recommender):
+    """Users with enough ratings to get a personalized feed."""
+    import numpy as np
+
+    counts = np.diff(recommender.interactions.matrix.indptr)
+    return recommender.interactions.user_ids[counts >= settings.RECOMMENDER_MIN_INTERACTIONS].tolist()
+
+
+def _init_worker(version):
+    import django
+    django.setup()
+    # Never reuse a connection inherited from the parent; the first query opens a fresh one
+    connections.close_all()
+    from .hybridRS import FEED_SIZE
+    global _worker_model, _worker_popular
+    _worker_model = model_store.load_model(version)
+    _worker_popular = Posts.most_popular(2 * FEED_SIZE)
+
+
+def _recommend_chunk(args):
+    user_ids, top_n = args
+    rows = []
+    for user_id in user_ids:
+        recommendations = _worker_model.recommend_blogs(user_id, [], popular=lambda k: _worker_popular[:k]).head(top_n)
+        for rank, (blog_id, score) in enumerate(zip(recommendations['blog_id'], recommendations['score']), start=1):
+            rows.append((user_id, rank, int(blog_id), float(score)))
+    return rows
+
+
+def precompute_snapshots(version=None, jobs=1, chunk_size=500, top_n=20, log=None):
+    """Write the top ``top_n`` recommendations of every active user for ``version`` and publish them."""
+    version = version or model_store.current_version()
+    recommender = model_store.load_model(version) if version else None
+    if recommender is None:
+        raise ValueError('No recommender model available; run `manage.py build_recommender` first.')
+
+    user_ids = active_user_ids(recommender)
+    chunks = [(user_ids[i:i + chunk_size], top_n) for i in range(0, len(user_ids), chunk_size)]
+    existing_posts = set(Posts.objects.values_list('id', flat=True))
+    jobs = jobs if jobs and jobs > 0 else os.cpu_count() or 1
+
+    RecommendationSnapshot.objects.filter(model_version=version).delete()
+    written = 0
+    batch = []
+    # Forked workers must not share the parent's open connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(version,)) as pool:
+        for rows in pool.map(_recommend_chunk, chunks):
+            batch.extend(
+                RecommendationSnapshot(user_id=user_id, rank=rank, blog_id=blog_id, score=score, model_version=version)
+                for user_id, rank, blog_id, score in rows if blog_id in existing_posts
+            )
+            if len(batch) >= BATCH_SIZE:
+                RecommendationSnapshot.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+                written += len(batch)
+                batch = []
+            if log:
+                log(f"{written + len(batch)} recommendations computed")
+    RecommendationSnapshot.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+    written += len(batch)
+
+    model_store.publish_snapshot_version(version)
+    RecommendationSnapshot.objects.exclude(model_version=version).delete()
+    return version, len(user_ids), written
+
+
+def snapshot_feed(user):
+    """Posts of the user's snapshot for the current model in rank order, or None if there is none."""
+    version = model_store.snapshot_version()
+    if version is None or version != model_store.current_version():
+        return None
+    posts = Posts.objects.filter(snapshots__user=user, snapshots__model_version=version).order_by('snapshots__rank')
+    return posts if posts.exists() else None
+
+
+def discard_snapshot(user_id):
+    """Drop ``user_id``'s snapshot rows so their feed is scored live until the next precompute."""
+    RecommendationSnapshot.objects.filter(user_id=user_id).delete()
@@ -0,0 +1,94 @@
+"""Seeded synthetic posts, ratings and preferences for benchmarking.
+
+The frames have the same columns as model_store.load_training_data(), so they
+can be fed straight into HybridRecommender. Post text is drawn from a
+Zipf-distributed pseudo-word vocabulary, with each category favouring its own
+words so that content neighbors are meaningful. User activity and post
+popularity are long-tailed, like real rating data.
+"""
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ['Tech', 'Health', 'Travel', 'Food', 'Finance', 'Sports', 'Science', 'Education', 'Entertainment', 'Lifestyle']
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'shi', 'den', 'pra', 'gul', 'zen', 'tor', 'mak', 'fel', 'bri']
+VOCABULARY_SIZE = 4000
+# Share of a post's words drawn from its category's own word ranking
+TOPIC_WORD_SHARE = 0.6
+BLOCK_POSTS = 10_000
+
+
+def zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_vocabulary(rng, size=VOCABULARY_SIZE):
+    words = [''.join(parts) for length in (2, 3) for parts in product(SYLLABLES, repeat=length)]
+    return np.array(words, dtype=object)[rng.permutation(len(words))[:size]]
+
+
+def generate_posts(rng, n_posts, words_per_post=150, n_authors=1000):
+    vocabulary = make_vocabulary(rng)
+    weights = zipf_weights(len(vocabulary))
+    categories = rng.integers(len(CATEGORIES), size=n_posts)
+    # Each category ranks the vocabulary differently
+    topic_orders = np.stack([rng.permutation(len(vocabulary)) for _ in CATEGORIES])
+
+    contents = []
+    titles = []
+    for start in range(0, n_posts, BLOCK_POSTS):
+        block_categories = categories[start:start + BLOCK_POSTS]
+        shape = (len(block_categories), words_per_post)
+        ranks = rng.choice(len(vocabulary), size=shape, p=weights).astype(np.int32)
+        topical = rng.random(shape) < TOPIC_WORD_SHARE
+        words = np.where(topical, topic_orders[block_categories[:, None], ranks], ranks)
+        contents.extend(' '.join(vocabulary[row]) for row in words)
+        titles.extend(' '.join(vocabulary[row[:4]]).title() for row in words)
+
+    return pd.DataFrame({
+        'blog_id': np.arange(1, n_posts + 1, dtype=np.int64),
+        'title': titles,
+        'content': contents,
+        'category__catName': np.array(CATEGORIES, dtype=object)[categories],
+        'author__username': [f'author{author}' for author in rng.integers(1, n_authors + 1, size=n_posts)],
+    })
+
+
+def generate_ratings(rng, n_users, n_posts, n_ratings):
+    """``n_ratings`` distinct (user, post) ratings between 0.5 and 5 in half steps."""
+    user_weights = zipf_weights(n_users, exponent=0.8)[rng.permutation(n_users)]
+    post_weights = zipf_weights(n_posts, exponent=0.8)[rng.permutation(n_posts)]
+    n_ratings = min(n_ratings, n_users * n_posts)
+    rating_df = pd.DataFrame({'user_id': [], 'blog_id': []}, dtype=np.int64)
+    # Popular pairs repeat, so keep drawing until there are enough distinct ones
+    while len(rating_df) < n_ratings:
+        draws = int((n_ratings - len(rating_df)) * 1.2) + 10
+        users = rng.choice(n_users, size=draws, p=user_weights)
+        posts = rng.choice(n_posts, size=draws, p=post_weights)
+        rating_df = pd.concat([rating_df, pd.DataFrame({'user_id': users + 1, 'blog_id': posts + 1})])
+        rating_df = rating_df.drop_duplicates(['user_id', 'blog_id'])
+    rating_df = rating_df.head(n_ratings)
+
+    quality = rng.normal(3.5, 0.6, size=n_posts)
+    noise = rng.normal(0, 0.8, size=len(rating_df))
+    ratings = np.clip(np.round((quality[rating_df['blog_id'].to_numpy() - 1] + noise) * 2) / 2, 0.5, 5.0)
+    return rating_df.assign(rating=ratings).reset_index(drop=True)
+
+
+def generate_preferences(rng, n_users, max_per_user=3):
+    counts = rng.integers(1, max_per_user + 1, size=n_users)
+    user_ids = np.repeat(np.arange(1, n_users + 1), counts)
+    # Category ids are 1-based positions in CATEGORIES
+    preferences = rng.integers(1, len(CATEGORIES) + 1, size=len(user_ids))
+    return pd.DataFrame({'user_id': user_ids, 'preference': preferences}).drop_duplicates().reset_index(drop=True)
+
+
+def generate_dataset(n_posts, n_users, n_ratings, seed=0, words_per_post=150):
+    """Return ``(blog_df, rating_df, preferences_df)``; the same arguments always give the same data."""
+    rng = np.random.default_rng(seed)
+    blog_df = generate_posts(rng, n_posts, words_per_post=words_per_post)
+    rating_df = generate_ratings(rng, n_users, n_posts, n_ratings)
+    preferences_df = generate_preferences(rng, n_users)
+    return blog_df, rating_df, preferences_df
@@ -0,0 +1,72 @@
+import numpy as np
+from scipy import sparse
+
+
+class TermPostings(object):
+    """Inverted index of a TF-IDF matrix that absorbs single-post edits without a rebuild.
+
+    ``postings`` is the transposed matrix as it was when the index was built: one
+    CSR row of (post row, weight) per term. It is never modified. ``rows`` maps
+    each of its post columns to the post's current row, or -1 once the post was
+    deleted or re-vectorized, and ``dirty`` lists the current rows whose vectors
+    are newer than ``postings``. Scores of dirty rows are computed directly from
+    the TF-IDF matrix, so an edit costs one pass over ``rows`` instead of
+    re-transposing the whole matrix.
+    """
+
+    def __init__(self, postings, rows=None, dirty=None):
+        self.postings = postings
+        # None while every column still maps to the row of the same number
+        self.rows = rows
+        self.dirty = dirty if dirty is not None else np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def build(cls, tfidf_matrix):
+        return cls(tfidf_matrix.T.tocsr())
+
+    def copy(self):
+        # postings is read-only and can be shared
+        return TermPostings(self.postings, None if self.rows is None else self.rows.copy(), self.dirty.copy())
+
+    def _mapped_rows(self):
+        if self.rows is None:
+            self.rows = np.arange(self.postings.shape[1], dtype=np.int64)
+        return self.rows
+
+    def update_row(self, row):
+        """Mark ``row``, edited or just appended, as newer than the stored postings."""
+        rows = self._mapped_rows()
+        rows[rows == row] = -1
+        self.dirty = np.union1d(self.dirty, [row])
+
+    def delete_row(self, row):
+        """Forget ``row`` and shift the rows after it up by one, as the TF-IDF matrix does."""
+        rows = self._mapped_rows()
+        rows[rows == row] = -1
+        rows[rows > row] -= 1
+        dirty = self.dirty[self.dirty != row]
+        self.dirty = np.where(dirty > row, dirty - 1, dirty)
+
+    def scores(self, tfidf_matrix, query_vector):
+        """Dot product of ``query_vector`` (a 1 x terms CSR row) with every row of ``tfidf_matrix``."""
+        stored = self.postings[query_vector.indices].T @ query_vector.data
+        if self.rows is None:
+            return stored
+        scores = np.zeros(tfidf_matrix.shape[0], dtype=stored.dtype)
+        live = self.rows >= 0
+        scores[self.rows[live]] = stored[live]
+        if len(self.dirty):
+            scores[self.dirty] = (tfidf_matrix[self.dirty] @ query_vector.T).toarray().ravel()
+        return scores
+
+    def save(self, path):
+        postings = sparse.csr_matrix(self.postings)
+        np.savez(path, data=postings.data, indices=postings.indices, indptr=postings.indptr,
+                 shape=np.array(postings.shape), rows=self.rows if self.rows is not None else np.empty(0, dtype=np.int64),
+                 mapped=np.bool_(self.rows is not None), dirty=self.dirty)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        postings = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+        return cls(postings, data['rows'] if bool(data['mapped']) else None, data['dirty'])
@@ -1,3 +1,662 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Max, QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import jobs, model_store
+from .metrics import registry, stage
+from .models import Category, Interaction, Posts, RecommendationSnapshot, RecommenderJob, UserPreference
+from .neighbors import ContentNeighborIndex
+from .recommendation_cache import recommendation_cache
+from .search import FTS5SearchIndex, PostingsSearchIndex, fts5_available, search_posts
+from .snapshots import snapshot_feed
+from .term_postings import TermPostings
+from .text_processing import TextPreprocessor
+from .user_neighbors import get_user_neighbors, rebuild_user_neighbor_table, refresh_candidates, refresh_user_neighbors
+
+
+def random_documents(n_rows=40, n_terms=25, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = sparse.random(n_rows, n_terms, density=0.3, random_state=rng, format='csr', dtype=np.float32)
+    return normalize(matrix).tocsr()
+
+
+class ContentNeighborIndexTests(TestCase):
+    """Incremental row updates must match rebuilding the index from scratch.
+
+    k is at least the number of rows, so no neighbor list is ever truncated and
+    the incremental result is exact rather than approximate.
+    """
+    K = 64
+    THRESHOLD = 0.05
+
+    def assertSameNeighbors(self, index, expected):
+        self.assertEqual(len(index), len(expected))
+        for row in range(len(expected)):
+            ids, scores = index.neighbors(row)
+            expected_ids, expected_scores = expected.neighbors(row)
+            self.assertEqual(sorted(ids.tolist()), sorted(expected_ids.tolist()), f'row {row}')
+            actual = dict(zip(ids.tolist(), scores.tolist()))
+            for other, score in zip(expected_ids.tolist(), expected_scores.tolist()):
+                self.assertAlmostEqual(actual[other], score, places=5)
+
+    def test_update_row_matches_build(self):
+        matrix = random_documents()
+        index = ContentNeighborIndex.build(matrix, k=self.K, threshold=self.THRESHOLD)
+
+        changed = random_documents(n_rows=1, seed=1)
+        matrix = sparse.vstack([matrix[:7], changed, matrix[8:]], format='csr')
+        index.update_row(7, (matrix @ changed.T).toarray().ravel())
+
+        self.assertSameNeighbors(index, ContentNeighborIndex.build(matrix, k=self.K, threshold=self.THRESHOLD))
+
+    def test_append_row_matches_build(self):
+        matrix = random_documents()
+        index = ContentNeighborIndex.build(matrix, k=self.K, threshold=self.THRESHOLD)
+
+        added = random_documents(n_rows=1, seed=2)
+        matrix = sparse.vstack([matrix, added], format='csr')
+        index.append_rows(1)
+        index.update_row(matrix.shape[0] - 1, (matrix @ added.T).toarray().ravel())
+
+        self.assertSameNeighbors(index, ContentNeighborIndex.build(matrix, k=self.K, threshold=self.THRESHOLD))
+
+    def test_delete_row_matches_build(self):
+        matrix = random_documents()
+        index = ContentNeighborIndex.build(matrix, k=self.K, threshold=self.THRESHOLD)
+
+        index.delete_row(11)
+        matrix = sparse.vstack([matrix[:11], matrix[12:]], format='csr')
+
+        self.assertSameNeighbors(index, ContentNeighborIndex.build(matrix, k=self.K, threshold=self.THRESHOLD))
+
+
+class TermPostingsTests(TestCase):
+    """Scores from the updated postings must equal scoring the current matrix directly."""
+
+    def assertScoresMatch(self, postings, matrix):
+        for seed in range(3):
+            query = random_documents(n_rows=1, seed=10 + seed)
+            np.testing.assert_allclose(postings.scores(matrix, query), (matrix @ query.T).toarray().ravel(), rtol=1e-5)
+
+    def test_edits_match_direct_scoring(self):
+        matrix = random_documents()
+        postings = TermPostings.build(matrix)
+        self.assertScoresMatch(postings, matrix)
+
+        changed = random_documents(n_rows=1, seed=1)
+        matrix = sparse.vstack([matrix[:7], changed, matrix[8:]], format='csr')
+        postings.update_row(7)
+        self.assertScoresMatch(postings, matrix)
+
+        matrix = sparse.vstack([matrix, random_documents(n_rows=1, seed=2)], format='csr')
+        postings.update_row(matrix.shape[0] - 1)
+        self.assertScoresMatch(postings, matrix)
+
+        for row in (3, 7, matrix.shape[0] - 3):
+            matrix = sparse.vstack([matrix[:row], matrix[row + 1:]], format='csr')
+            postings.delete_row(row)
+            self.assertScoresMatch(postings, matrix)
+
+    def test_save_and_load_keep_pending_edits(self):
+        matrix = random_documents()
+        postings = TermPostings.build(matrix)
+        matrix = sparse.vstack([matrix[:5], matrix[6:]], format='csr')
+        postings.delete_row(5)
+        path = os.path.join(tempfile.mkdtemp(), 'postings.npz')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        postings.save(path)
+        self.assertScoresMatch(TermPostings.load(path), matrix)
+
+
+def plain_preprocessor(*args, **kwargs):
+    # No lemmatizer or stopword list, so the tests do not need the NLTK corpora
+    return TextPreprocessor(flg_stemm=False, flg_lemm=False)
+
+
+class RecommenderTestData(object):
+
+    def create_posts(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.users = [User.objects.create_user(f'reader{i}', password='x') for i in range(4)]
+        self.tech = Category.objects.create(catName='Tech')
+        self.life = Category.objects.create(catName='Life')
+        texts = [
+            ('Python tips', 'python code functions python testing', self.tech),
+            ('Django models', 'django python models database queries', self.tech),
+            ('Database tuning', 'database queries indexes tuning', self.tech),
+            ('Garden days', 'garden flowers soil summer', self.life),
+            ('Summer cooking', 'summer cooking vegetables garden', self.life),
+            ('Baking bread', 'bread flour oven baking', self.life),
+        ]
+        self.posts = [
+            Posts.objects.create(title=title, content=content, post_url='https://example.com', author=self.author, category=category)
+            for title, content, category in texts
+        ]
+        for user_number, user in enumerate(self.users):
+            for post_number, post in enumerate(self.posts):
+                if (user_number + post_number) % 2 == 0:
+                    Interaction.objects.create(user_id=user, blog_id=post, rating=Decimal('4.0'))
+
+
+class SearchIndexTests(RecommenderTestData, TestCase):
+
+    def setUp(self):
+        self.create_posts()
+        Posts.objects.create(title='Life lessons', content='notes', post_url='https://example.com',
+                             author=self.author, category=self.tech)
+
+    def skipUnlessFTS5(self):
+        # Migration 0011 creates the FTS5 table when this SQLite build supports it
+        if not fts5_available():
+            self.skipTest('SQLite without FTS5')
+
+    def ranked_titles(self, index, query):
+        return [Posts.objects.get(pk=post_id).title for post_id, _ in index.search(query)]
+
+    def assertRanksFields(self, index):
+        index.rebuild()
+        self.assertEqual(self.ranked_titles(index, 'python'), ['Python tips'])
+        # A title match outranks the three category matches, and prefixes match
+        self.assertEqual(self.ranked_titles(index, 'lif')[0], 'Life lessons')
+        self.assertEqual(len(self.ranked_titles(index, 'life')), 4)
+        # Every token must match
+        self.assertEqual(self.ranked_titles(index, 'garden life'), ['Garden days'])
+        # Author names are indexed too
+        self.assertEqual(len(self.ranked_titles(index, 'author')), Posts.objects.count())
+        self.assertEqual(index.search('nothing matches'), [])
+
+    def test_fts5_ranking(self):
+        self.skipUnlessFTS5()
+        self.assertRanksFields(FTS5SearchIndex())
+
+    def test_postings_ranking(self):
+        self.assertRanksFields(PostingsSearchIndex())
+
+    def assertKeepsIndexCurrent(self, index):
+        with mock.patch('blog.search._index', index):
+            index.rebuild()
+            post = self.posts[0]
+            post.title = 'Rust tips'
+            post.save()
+            self.assertEqual([p.title for p in search_posts('rust')], ['Rust tips'])
+            self.assertEqual(search_posts('python'), [])
+
+            post.delete()
+            self.assertEqual(search_posts('rust'), [])
+
+    def test_fts5_follows_saves_and_deletes(self):
+        self.skipUnlessFTS5()
+        self.assertKeepsIndexCurrent(FTS5SearchIndex())
+
+    def test_postings_follow_saves_and_deletes(self):
+        self.assertKeepsIndexCurrent(PostingsSearchIndex())
+
+    def assertFollowsRenames(self, index):
+        with mock.patch('blog.search._index', index):
+            index.rebuild()
+            self.author.username = 'writer'
+            self.author.save()
+            self.life.catName = 'Outdoors'
+            self.life.save()
+            self.assertEqual(len(search_posts('writer')), Posts.objects.count())
+            self.assertEqual(search_posts('author'), [])
+            self.assertEqual({post.title for post in search_posts('outdoors')},
+                             {'Garden days', 'Summer cooking', 'Baking bread'})
+            self.assertEqual([post.title for post in search_posts('life')], ['Life lessons'])
+
+    def test_fts5_follows_author_and_category_renames(self):
+        self.skipUnlessFTS5()
+        self.assertFollowsRenames(FTS5SearchIndex())
+
+    def test_postings_follow_author_and_category_renames(self):
+        self.assertFollowsRenames(PostingsSearchIndex())
+
+
+class ImportRatingsTests(RecommenderTestData, TestCase):
+
+    def setUp(self):
+        self.create_posts()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def import_csv(self, rows):
+        path = os.path.join(self.directory, 'ratings.csv')
+        with open(path, 'w') as f:
+            f.write('blog_id,user_id,rating\n' + ''.join(f'{row}\n' for row in rows))
+        output = StringIO()
+        with mock.patch('sys.stderr', StringIO()):
+            call_command('import_ratings', file=path, stdout=output)
+        return output.getvalue()
+
+    def test_reimport_upserts_and_rebuilds_aggregates(self):
+        post, reader = self.posts[1], self.users[0]
+        before = Interaction.objects.count()
+        self.import_csv([f'{post.id},{reader.id},1.0'])
+        self.import_csv([f'{post.id},{reader.id},2.0', f'{post.id},{reader.id},3.0'])
+
+        self.assertEqual(Interaction.objects.count(), before + 1)
+        self.assertEqual(Interaction.objects.get(blog_id=post, user_id=reader).rating, Decimal('3.0'))
+        post.refresh_from_db()
+        # Readers 1 and 3 rated it 4.0 in create_posts
+        self.assertEqual((post.rating_count, post.rating_sum, post.avg_rating), (3, Decimal('11.0'), 11.0 / 3))
+
+    def test_malformed_rows_are_skipped(self):
+        post, reader = self.posts[1], self.users[0]
+        output = self.import_csv(['x,1,3.0', f'{post.id},,2.0', str(post.id), f'{post.id},{reader.id},abc',
+                                  f'{post.id},{reader.id},nan', f'{post.id},{reader.id},inf', f'{post.id},{reader.id},4.5'])
+        self.assertIn('Skipped 6 rows', output)
+        self.assertEqual(Interaction.objects.get(blog_id=post, user_id=reader).rating, Decimal('4.5'))
+
+
+class TemporaryModelDirMixin(object):
+    """Point RECOMMENDER_MODEL_DIR at a fresh directory and forget any loaded model."""
+
+    def use_temporary_model_dir(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir, ignore_errors=True)
+        settings_override = override_settings(RECOMMENDER_MODEL_DIR=self.model_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        model_store._loaded.update(version=None, model=None)
+        self.addCleanup(model_store._loaded.update, version=None, model=None)
+
+
+class ModelUpdateReplayTests(TemporaryModelDirMixin, RecommenderTestData, TestCase):
+
+    def setUp(self):
+        for target, replacement in [('blog.hybridRS.english_stopwords', lambda: frozenset()),
+                                    ('blog.hybridRS.get_preprocessor', plain_preprocessor)]:
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.use_temporary_model_dir()
+
+        self.create_posts()
+        model_store.save_model(model_store.build_model())
+
+    def test_replays_post_edits_without_touching_the_served_model(self):
+        served = model_store.get_current_model()
+        served_rows = len(served.blog_df)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post = Posts.objects.create(title='Query plans', content='database queries indexes plans',
+                                            post_url='https://example.com', author=self.author, category=self.tech)
+        deleted_id = self.posts[5].id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[5].delete()
+        self.assertEqual(model_store.pending_update_count(model_store.current_version()), 2)
+
+        updated = model_store.get_current_model()
+        self.assertIsNot(updated, served)
+        blog_ids = updated.blog_df['blog_id'].tolist()
+        self.assertIn(new_post.id, blog_ids)
+        self.assertNotIn(deleted_id, blog_ids)
+        self.assertEqual(updated.tfidf_matrix.shape[0], len(updated.blog_df))
+        self.assertEqual(len(updated.content_neighbors), len(updated.blog_df))
+        neighbor_rows, _ = updated.content_neighbors.neighbors(blog_ids.index(new_post.id))
+        self.assertIn(self.posts[2].id, updated.blog_df['blog_id'].iloc[neighbor_rows].tolist())
+        # The persisted search postings follow the edits
+        self.assertEqual({blog_id for blog_id, _ in updated.search('indexes')}, {self.posts[2].id, new_post.id})
+        self.assertEqual([blog_id for blog_id, _ in updated.search('bread')], [])
+        self.assertEqual([blog_id for blog_id, _ in served.search('bread')], [deleted_id])
+
+        # The model handed out before the edits is unchanged
+        self.assertEqual(len(served.blog_df), served_rows)
+        self.assertEqual(served.tfidf_matrix.shape[0], served_rows)
+        self.assertEqual(len(served.content_neighbors), served_rows)
+        self.assertIn(deleted_id, served.blog_df['blog_id'].tolist())
+
+        # Nothing new in the log: the same model is served again
+        self.assertIs(model_store.get_current_model(), updated)
+
+    def test_rebuild_keeps_edits_logged_while_it_ran(self):
+        rebuilt = model_store.build_model()
+        # Logged against the old version after the rebuild read the database
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post = Posts.objects.create(title='Query plans', content='database queries indexes plans',
+                                            post_url='https://example.com', author=self.author, category=self.tech)
+        self.assertNotIn(new_post.id, rebuilt.blog_df['blog_id'].tolist())
+
+        version = model_store.save_model(rebuilt)
+        self.assertEqual(model_store.pending_update_count(version), 1)
+        self.assertIn(new_post.id, model_store.get_current_model().blog_df['blog_id'].tolist())
+
+
+class SnapshotFeedTests(TemporaryModelDirMixin, RecommenderTestData, TestCase):
+
+    def setUp(self):
+        self.use_temporary_model_dir()
+        self.create_posts()
+        self.reader = self.users[0]
+        for rank, post in enumerate(self.posts[:3], start=1):
+            RecommendationSnapshot.objects.create(user=self.reader, rank=rank, blog=post, score=1.0 / rank, model_version='v1')
+        model_store.publish_snapshot_version('v1')
+
+    def test_served_while_its_model_is_current(self):
+        model_store.publish_version('v1')
+        self.assertEqual(list(snapshot_feed(self.reader)), self.posts[:3])
+
+    def test_ignored_once_a_newer_model_is_published(self):
+        model_store.publish_version('v2')
+        self.assertIsNone(snapshot_feed(self.reader))
+
+    def test_dropped_when_the_user_rates(self):
+        model_store.publish_version('v1')
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(f'/rate/{self.posts[1].id}/5.0/').status_code, 200)
+        self.assertIsNone(snapshot_feed(self.reader))
+
+
+class RankedFeedTests(TemporaryModelDirMixin, RecommenderTestData, TestCase):
+
+    def setUp(self):
+        self.use_temporary_model_dir()
+        self.create_posts()
+        self.reader = self.users[0]
+        for post in self.posts[1::2]:
+            Interaction.objects.create(user_id=self.reader, blog_id=post, rating=Decimal('3.0'))
+
+    def test_feed_keeps_the_fused_order(self):
+        ranked = [self.posts[i] for i in (4, 0, 5, 2, 1)]
+        with mock.patch('blog.views.get_current_model', return_value=mock.Mock()), \
+                mock.patch('blog.views.recommended_blog_ids', return_value=[post.id for post in ranked]):
+            self.client.force_login(self.reader)
+            response = self.client.get('/')
+        self.assertEqual(list(response.context['posts']), ranked)
+        content = response.content.decode()
+        positions = [content.index(f'>{post.title}</a>') for post in ranked]
+        self.assertEqual(positions, sorted(positions))
+
+
+class RecommendationCacheInvalidationTests(RecommenderTestData, TestCase):
+
+    def setUp(self):
+        self.create_posts()
+        self.reader = self.users[0]
+        recommendation_cache.cache.clear()
+        self.addCleanup(recommendation_cache.cache.clear)
+
+    def cache(self, user):
+        recommendation_cache.get_or_compute(user.id, 'v1', lambda: 'cached')
+
+    def is_cached(self, user):
+        return recommendation_cache.get_or_compute(user.id, 'v1', lambda: 'fresh') == 'cached'
+
+    def test_served_until_invalidated(self):
+        self.cache(self.reader)
+        self.assertTrue(self.is_cached(self.reader))
+        self.assertFalse(self.is_cached(self.users[1]))
+
+    def test_rating_invalidates(self):
+        self.cache(self.reader)
+        self.cache(self.users[1])
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(f'/rate/{self.posts[1].id}/4.0/').status_code, 200)
+        self.assertFalse(self.is_cached(self.reader))
+        self.assertTrue(self.is_cached(self.users[1]))
+
+    def test_preference_changes_invalidate(self):
+        self.cache(self.reader)
+        preference = UserPreference.objects.create(user=self.reader)
+        self.assertFalse(self.is_cached(self.reader))
+
+        self.cache(self.reader)
+        preference.preference.set([self.tech])
+        self.assertFalse(self.is_cached(self.reader))
+
+        self.cache(self.reader)
+        preference.preference.clear()
+        self.assertFalse(self.is_cached(self.reader))
+
+        self.cache(self.reader)
+        preference.delete()
+        self.assertFalse(self.is_cached(self.reader))
+
+
+class SubmitRatingViewTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.post = Posts.objects.create(title='Post', content='text', post_url='https://example.com', author=self.author,
+                                         category=Category.objects.create(catName='Tech'))
+        self.reader = User.objects.create_user('reader', password='x')
+
+    def rate(self, user, rating):
+        self.client.force_login(user)
+        response = self.client.get(f'/rate/{self.post.id}/{rating}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_record_rating_keeps_aggregates_in_step(self):
+        self.assertEqual(self.rate(self.reader, 4.0)['average_rating'], 4.0)
+        self.assertEqual(self.rate(self.author, 2.0)['average_rating'], 3.0)
+        # Re-rating replaces the reader's rating instead of adding one
+        self.assertEqual(self.rate(self.reader, 5.0)['average_rating'], 3.5)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.rating_count, 2)
+        self.assertEqual(self.post.rating_sum, Decimal('7.0'))
+        self.assertEqual(self.post.avg_rating, 3.5)
+        # Damped average with the default prior of 5 ratings of 3.0
+        self.assertAlmostEqual(self.post.popularity, (7.0 + 15.0) / (2 + 5))
+        self.assertEqual(Interaction.objects.filter(blog_id=self.post).count(), 2)
+
+    def test_anonymous_users_cannot_rate(self):
+        response = self.client.get(f'/rate/{self.post.id}/4.0/')
+        self.assertEqual(response.status_code, 403)
+
+
+class RefreshUserNeighborsTests(RecommenderTestData, TestCase):
+
+    def setUp(self):
+        self.create_posts()
+        self.reader = self.users[0]
+        # reader1 shares one blog with reader0, reader2 shares all three
+        Interaction.objects.create(user_id=self.users[1], blog_id=self.posts[0], rating=Decimal('3.0'))
+
+    def test_candidates_are_the_co_raters_with_most_overlap(self):
+        self.assertEqual(refresh_candidates(self.reader.id), [self.users[2].id, self.users[1].id])
+        self.assertEqual(refresh_candidates(self.reader.id, limit=1), [self.users[2].id])
+
+    def test_rebuild_uses_the_approximate_engine(self):
+        import pandas as pd
+        from .ann import RandomProjectionLSH
+        from .interactions import InteractionMatrix
+
+        ratings = pd.DataFrame(list(Interaction.objects.values_list('user_id', 'blog_id', 'rating')),
+                               columns=['user_id', 'blog_id', 'rating'])
+        interactions = InteractionMatrix.from_ratings(ratings)
+        index = RandomProjectionLSH.build(interactions, n_tables=4, n_bits=2)
+        with mock.patch.object(interactions, 'iter_similar_users') as exact:
+            rebuild_user_neighbor_table(interactions, k=3, user_index=index)
+        exact.assert_not_called()
+
+        for row, user_id in enumerate(interactions.user_ids):
+            neighbor_rows, _ = index.similar_users(row, 3)
+            expected = [int(interactions.user_ids[neighbor]) for neighbor in neighbor_rows]
+            self.assertEqual(sorted(neighbor for neighbor, _ in get_user_neighbors(int(user_id), 3)), sorted(expected))
+
+    def test_refresh_only_touches_candidates(self):
+        refresh_user_neighbors(self.reader.id, candidates=1)
+        self.assertEqual([neighbor for neighbor, _ in get_user_neighbors(self.reader.id, 10)], [self.users[2].id])
+        self.assertEqual([neighbor for neighbor, _ in get_user_neighbors(self.users[2].id, 10)], [self.reader.id])
+        self.assertEqual(get_user_neighbors(self.users[1].id, 10), [])
+
+
+class JobQueueTests(TemporaryModelDirMixin, RecommenderTestData, TestCase):
+
+    def setUp(self):
+        self.use_temporary_model_dir()
+
+    def test_enqueue_folds_into_the_pending_job(self):
+        job, created = jobs.enqueue(reason='first')
+        self.assertTrue(created)
+        again, created = jobs.enqueue(reason='second')
+        self.assertFalse(created)
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual(again.requests, 2)
+        self.assertEqual(RecommenderJob.objects.count(), 1)
+
+    def test_enqueue_after_claim_creates_a_new_job(self):
+        job, _ = jobs.enqueue()
+        jobs.claim_next('worker-1')
+        second, created = jobs.enqueue()
+        self.assertTrue(created)
+        self.assertNotEqual(second.pk, job.pk)
+
+    def test_claim_next_marks_the_job_running(self):
+        job, _ = jobs.enqueue()
+        claimed = jobs.claim_next('worker-1')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, RecommenderJob.RUNNING)
+        self.assertEqual(claimed.worker, 'worker-1')
+        self.assertIsNotNone(claimed.started_at)
+        self.assertIsNone(jobs.claim_next('worker-2'))
+
+    def test_claim_next_loses_a_race_gracefully(self):
+        jobs.enqueue()
+        first = QuerySet.first
+        stolen = []
+
+        def first_then_claim_elsewhere(queryset):
+            job = first(queryset)
+            if job is not None and not stolen:
+                # Another worker claims the job between the read and the compare-and-set
+                RecommenderJob.objects.filter(pk=job.pk).update(status=RecommenderJob.RUNNING, worker='worker-2')
+                stolen.append(job.pk)
+            return job
+
+        with mock.patch.object(QuerySet, 'first', first_then_claim_elsewhere):
+            self.assertIsNone(jobs.claim_next('worker-1'))
+        self.assertEqual(RecommenderJob.objects.get(pk=stolen[0]).worker, 'worker-2')
+
+    def start_job(self, hours_ago):
+        return RecommenderJob.objects.create(status=RecommenderJob.RUNNING, worker='gone',
+                                             started_at=timezone.now() - timedelta(hours=hours_ago))
+
+    def test_requeue_stale_jobs(self):
+        stale = self.start_job(hours_ago=7)
+        fresh = self.start_job(hours_ago=1)
+        self.assertEqual(jobs.requeue_stale_jobs(6 * 60 * 60), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker, stale.started_at), (RecommenderJob.PENDING, '', None))
+        self.assertEqual(fresh.status, RecommenderJob.RUNNING)
+
+    def test_requeue_fails_stale_jobs_already_covered_by_a_pending_one(self):
+        stale = self.start_job(hours_ago=7)
+        pending, _ = jobs.enqueue()
+        self.assertEqual(jobs.requeue_stale_jobs(6 * 60 * 60), 0)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, RecommenderJob.FAILED)
+        self.assertEqual(RecommenderJob.objects.filter(status=RecommenderJob.PENDING).get().pk, pending.pk)
+
+    def publish_manifest(self, version, max_interaction_id, updates=0):
+        path = os.path.join(self.model_dir, version)
+        os.makedirs(path)
+        with open(os.path.join(path, model_store.MANIFEST_FILE), 'w') as f:
+            json.dump({'version': version, 'max_interaction_id': max_interaction_id}, f)
+        with open(os.path.join(path, model_store.UPDATES_FILE), 'w') as f:
+            f.write(''.join(json.dumps({'op': 'delete', 'blog_id': 0}) + '\n' for _ in range(updates)))
+        model_store.publish_version(version)
+
+    @override_settings(RECOMMENDER_REBUILD_AFTER_INTERACTIONS=5, RECOMMENDER_REBUILD_AFTER_UPDATES=3)
+    def test_rebuild_reason_thresholds(self):
+        self.assertEqual(jobs.rebuild_reason(), 'no model published')
+        model_store.publish_version('missing')
+        self.assertEqual(jobs.rebuild_reason(), 'model missing is missing')
+
+        self.create_posts()
+        max_id = Interaction.objects.aggregate(max_id=Max('id'))['max_id']
+        self.publish_manifest('v1', max_id - 4, updates=2)
+        self.assertIsNone(jobs.rebuild_reason())
+        self.assertIsNone(jobs.enqueue_if_stale())
+
+        self.publish_manifest('v2', max_id - 5, updates=2)
+        self.assertEqual(jobs.rebuild_reason(), '5 new ratings since model v2')
+        self.assertEqual(jobs.enqueue_if_stale().reason, '5 new ratings since model v2')
+
+        self.publish_manifest('v3', max_id, updates=3)
+        self.assertEqual(jobs.rebuild_reason(), '3 post edits since model v3')
+
+    def test_unpublished_rebuild_keeps_the_neighbor_table(self):
+        recommender = mock.Mock()
+        with mock.patch.object(model_store, 'build_model', return_value=recommender), \
+                mock.patch.object(model_store, 'save_model', return_value='v1') as save_model, \
+                mock.patch('blog.user_neighbors.rebuild_user_neighbor_table') as rebuild_table:
+            self.assertEqual(jobs.rebuild_model(publish=False), 'v1')
+            save_model.assert_called_once_with(recommender, publish=False)
+            rebuild_table.assert_not_called()
+
+            jobs.rebuild_model()
+            rebuild_table.assert_called_once_with(recommender.interactions, user_index=recommender.user_index)
+
+
+@override_settings(RECOMMENDER_METRICS_ENABLED=True)
+class StageMetricsTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def test_stage_counts_its_queries(self):
+        with stage('test.stage'):
+            list(Category.objects.all())
+            list(Posts.objects.all())
+        self.assertEqual(registry.snapshot()['test.stage']['queries_sum'], 2)
+
+    def test_stage_without_query_count_only_records_time(self):
+        with stage('test.stage', count_queries=False):
+            list(Category.objects.all())
+        metrics = registry.snapshot()['test.stage']
+        self.assertEqual(metrics['count'], 1)
+        self.assertEqual(metrics['queries_buckets'][-1], ['inf', 0])
+
+
+class MigrationTests(TransactionTestCase):
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+
+    def test_migrate_from_empty(self):
+        call_command('migrate', 'blog', 'zero', verbosity=0)
+        call_command('migrate', verbosity=0)
+        self.assertIn('blog_recommenderjob', connection.introspection.table_names())
+
+    def test_rating_backfills_on_existing_data(self):
+        self.migrate([('blog', '0009_recommendationsnapshot')])
+        apps = MigrationExecutor(connection).loader.project_state([('blog', '0009_recommendationsnapshot')]).apps
+        author = apps.get_model('auth', 'User').objects.create(username='author')
+        category = apps.get_model('blog', 'Category').objects.create(catName='Tech')
+        post = apps.get_model('blog', 'Posts').objects.create(title='Post', content='text', post_url='https://example.com',
+                                                              author_id=author.id, category_id=category.id)
+        Interaction = apps.get_model('blog', 'Interaction')
+        Interaction.objects.create(user_id_id=author.id, blog_id_id=post.id, rating=Decimal('4.0'))
+        # A duplicate left by an old import; 0012 keeps the newest row
+        Interaction.objects.create(user_id_id=author.id, blog_id_id=post.id, rating=Decimal('2.0'))
+
+        call_command('migrate', verbosity=0)
+
+        post = Posts.objects.get(pk=post.id)
+        self.assertEqual(post.rating_count, 1)
+        self.assertEqual(post.rating_sum, Decimal('2.0'))
+        self.assertEqual(post.avg_rating, 2.0)
+        self.assertAlmostEqual(post.popularity, (2.0 + 15.0) / (1 + 5))
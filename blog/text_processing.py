@@ -0,0 +1,126 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import nltk
+from nltk import corpus
+from nltk.stem import WordNetLemmatizer
+from nltk.stem import PorterStemmer
+
+# NLTK resources the preprocessor loads, as (path for nltk.data.find, package for nltk.download)
+REQUIRED_CORPORA = [
+    ('corpora/stopwords', 'stopwords'),
+    ('corpora/wordnet', 'wordnet'),
+    ('corpora/omw-1.4', 'omw-1.4'),
+]
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+DEFAULT_CACHE_SIZE = 200_000
+DEFAULT_CHUNK_SIZE = 2_000
+
+
+def nltk_data_dir():
+    """settings.RECOMMENDER_NLTK_DATA, or None outside a configured Django project."""
+    from django.conf import settings
+    if not settings.configured:
+        return None
+    return getattr(settings, 'RECOMMENDER_NLTK_DATA', None)
+
+
+def use_local_corpora():
+    """Search the project's NLTK data directory before nltk's defaults; never downloads."""
+    path = nltk_data_dir()
+    if path and str(path) not in nltk.data.path:
+        nltk.data.path.insert(0, str(path))
+
+
+def missing_corpora():
+    """Packages of REQUIRED_CORPORA that nltk cannot find on its search path."""
+    use_local_corpora()
+    missing = []
+    for resource, package in REQUIRED_CORPORA:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            try:
+                nltk.data.find(resource + '.zip')
+            except LookupError:
+                missing.append(package)
+    return missing
+
+
+use_local_corpora()
+
+
+@lru_cache(maxsize=None)
+def english_stopwords():
+    return frozenset(corpus.stopwords.words('english'))
+
+
+class TextPreprocessor(object):
+    """Cleans, filters and lemmatizes/stems text for the TF-IDF models.
+
+    The stopword table is a frozenset and the lemmatizer/stemmer are created once,
+    with a bounded LRU cache in front of them since a corpus repeats the same
+    tokens over and over.
+    """
+
+    def __init__(self, flg_stemm=False, flg_lemm=True, stopwords=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.flg_stemm = flg_stemm
+        self.flg_lemm = flg_lemm
+        self.stopwords = frozenset(stopwords) if stopwords is not None else frozenset()
+        self.cache_size = cache_size
+        self.lemmatizer = WordNetLemmatizer() if flg_lemm else None
+        self.stemmer = PorterStemmer() if flg_stemm else None
+        self.normalize_token = lru_cache(maxsize=cache_size)(self._normalize_token)
+
+    def _normalize_token(self, word):
+        if self.lemmatizer is not None:
+            word = self.lemmatizer.lemmatize(word)
+        if self.stemmer is not None:
+            word = self.stemmer.stem(word)
+        return word
+
+    def process(self, text):
+        """Preprocess one text: lowercase, strip punctuation, drop stopwords, normalize tokens."""
+        text = PUNCTUATION_RE.sub('', str(text).lower().strip())
+        stopwords = self.stopwords
+        normalize = self.normalize_token
+        return " ".join([normalize(word) for word in text.split() if word not in stopwords])
+
+    def process_many(self, texts, n_jobs=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Preprocess an iterable of texts, fanning chunks out to ``n_jobs`` processes."""
+        texts = list(texts)
+        if n_jobs is None or n_jobs < 1:
+            n_jobs = os.cpu_count() or 1
+        if n_jobs == 1 or len(texts) <= chunk_size:
+            return [self.process(text) for text in texts]
+
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(self.flg_stemm, self.flg_lemm, self.stopwords, self.cache_size)) as pool:
+            results = []
+            for chunk_result in pool.map(_process_chunk, chunks):
+                results.extend(chunk_result)
+        return results
+
+    def cache_info(self):
+        return self.normalize_token.cache_info()
+
+
+@lru_cache(maxsize=8)
+def get_preprocessor(flg_stemm=False, flg_lemm=True, stopwords=None):
+    """Shared TextPreprocessor for a given configuration; ``stopwords`` must be hashable."""
+    return TextPreprocessor(flg_stemm=flg_stemm, flg_lemm=flg_lemm, stopwords=stopwords)
+
+
+_worker_preprocessor = None
+
+
+def _init_worker(flg_stemm, flg_lemm, stopwords, cache_size):
+    global _worker_preprocessor
+    _worker_preprocessor = TextPreprocessor(flg_stemm, flg_lemm, stopwords, cache_size)
+
+
+def _process_chunk(texts):
+    return [_worker_preprocessor.process(text) for text in texts]
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, register_converter
 from . import views
-from .views import PostListView, PostDetailView, PostCreateView, PostUpdateView, PostDeleteView, UserPostListView, SubmitRatingView, SearchResultsView
+from .views import PostListView, PostDetailView, PostCreateView, PostUpdateView, PostDeleteView, UserPostListView, SubmitRatingView, SearchResultsView, RecommendationCacheStatsView, MetricsView
+from .views import AsyncPostListView, AsyncSearchResultsView
 
 class FloatConverter:
     regex = r'\d+(\.\d+)?'  # Matches integers and floats
@@ -14,8 +16,13 @@ class FloatConverter:
 # Register the converter
 register_converter(FloatConverter, 'float')
 
+if settings.RECOMMENDER_ASYNC_VIEWS:
+    FeedView, SearchView = AsyncPostListView, AsyncSearchResultsView
+else:
+    FeedView, SearchView = PostListView, SearchResultsView
+
 urlpatterns = [
-    path('', PostListView.as_view(), name='blog-home'),
+    path('', FeedView.as_view(), name='blog-home'),
     path('user/<str:username>', UserPostListView.as_view(), name='user-posts'),
     path('post/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
     path('post/<int:pk>/update/', PostUpdateView.as_view(), name='post-update'),
@@ -23,5 +30,7 @@ urlpatterns = [
     path('post/new/', PostCreateView.as_view(), name='post-create'),
     path('about/', views.about, name='blog-about'),
     path('rate/<int:post_id>/<float:rating>/', SubmitRatingView.as_view(), name='submit-rating'),
-    path("search/", SearchResultsView.as_view(), name="search-results"),
+    path("search/", SearchView.as_view(), name="search-results"),
+    path('recommendations/cache-stats/', RecommendationCacheStatsView.as_view(), name='recommendation-cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
@@ -0,0 +1,123 @@
+"""Persisted top-k user neighbor table used by collaborative filtering.
+
+The table is rebuilt in bulk with each published model, through the model's
+neighbor engine (RECOMMENDER_NEIGHBOR_ENGINE), and kept fresh between rebuilds by
+refresh_user_neighbors(), which SubmitRatingView calls after each rating write.
+A refresh only loads the ratings of the RECOMMENDER_NEIGHBOR_REFRESH_CANDIDATES
+co-raters sharing the most blogs with the user; the next rebuild sees everyone.
+Picking those candidates is still one GROUP BY over every rating of every blog
+the user rated, run synchronously in the rating request, so a user who rated
+very popular blogs pays for the size of their audience in that query.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Interaction, UserNeighbor
+
+BATCH_SIZE = 5000
+
+
+def neighbor_count():
+    return settings.RECOMMENDER_USER_NEIGHBORS
+
+
+def neighbor_lists(interactions, k, user_index=None):
+    """Yield ``(row, neighbor_rows, similarities)`` for every user, through ``user_index`` unless it is exact.
+
+    The exact engine is served by the blocked all-pairs product; an approximate
+    engine such as LSH answers one lookup per user instead, so building the
+    table costs what the engine was chosen to save.
+    """
+    if user_index is None or user_index.name == 'exact':
+        yield from interactions.iter_similar_users(k)
+        return
+    for row in range(interactions.shape[0]):
+        neighbor_rows, similarities = user_index.similar_users(row, k)
+        yield row, neighbor_rows, similarities
+
+
+def rebuild_user_neighbor_table(interactions, k=None, user_index=None):
+    """Replace the whole table with the top-k neighbors of every user in ``interactions``."""
+    k = k or neighbor_count()
+    user_ids = interactions.user_ids
+    with transaction.atomic():
+        UserNeighbor.objects.all().delete()
+        batch = []
+        for row, neighbor_rows, similarities in neighbor_lists(interactions, k, user_index):
+            user_id = int(user_ids[row])
+            batch.extend(
+                UserNeighbor(user_id=user_id, neighbor_id=int(user_ids[neighbor]), similarity=float(similarity))
+                for neighbor, similarity in zip(neighbor_rows, similarities)
+            )
+            if len(batch) >= BATCH_SIZE:
+                UserNeighbor.objects.bulk_create(batch)
+                batch = []
+        UserNeighbor.objects.bulk_create(batch)
+
+
+def refresh_candidates(user_id, limit=None):
+    """Ids of the ``limit`` users who rated the most of the blogs ``user_id`` rated.
+
+    The overlap count reads every rating of those blogs; only the result is capped.
+    """
+    limit = limit or settings.RECOMMENDER_NEIGHBOR_REFRESH_CANDIDATES
+    rated_blogs = Interaction.objects.filter(user_id=user_id).values('blog_id')
+    return list(
+        Interaction.objects.filter(blog_id__in=rated_blogs).exclude(user_id=user_id)
+        .values('user_id').annotate(overlap=Count('id')).order_by('-overlap', 'user_id')
+        .values_list('user_id', flat=True)[:limit]
+    )
+
+
+def refresh_user_neighbors(user_id, k=None, candidates=None):
+    """Recompute ``user_id``'s neighbors and its edge in the lists of its strongest co-raters."""
+    import pandas as pd
+    from .interactions import InteractionMatrix
+
+    k = k or neighbor_count()
+    co_raters = refresh_candidates(user_id, candidates) + [user_id]
+    ratings = pd.DataFrame(
+        list(Interaction.objects.filter(user_id__in=co_raters).values_list('user_id', 'blog_id', 'rating')),
+        columns=['user_id', 'blog_id', 'rating'],
+    )
+    interactions = InteractionMatrix.from_ratings(ratings)
+    row = interactions.user_row(user_id)
+    if row is None:
+        return
+
+    # Similarity of user_id to each candidate
+    neighbor_rows, similarities = interactions.similar_users(row, interactions.shape[0])
+    pair_similarity = {
+        int(interactions.user_ids[neighbor]): float(similarity)
+        for neighbor, similarity in zip(neighbor_rows, similarities) if similarity > 0
+    }
+    own_neighbors = list(pair_similarity.items())[:k]
+
+    existing = {}
+    for link in UserNeighbor.objects.filter(user_id__in=list(pair_similarity)).exclude(neighbor_id=user_id):
+        existing.setdefault(link.user_id, []).append((link.neighbor_id, link.similarity))
+
+    links = [UserNeighbor(user_id=user_id, neighbor_id=neighbor_id, similarity=similarity)
+             for neighbor_id, similarity in own_neighbors]
+    touched = [user_id]
+    for other_id, similarity in pair_similarity.items():
+        current = existing.get(other_id, [])
+        if len(current) >= k and similarity <= min(s for _, s in current):
+            continue
+        merged = sorted(current + [(user_id, similarity)], key=lambda item: -item[1])[:k]
+        links.extend(UserNeighbor(user_id=other_id, neighbor_id=neighbor_id, similarity=s) for neighbor_id, s in merged)
+        touched.append(other_id)
+
+    with transaction.atomic():
+        UserNeighbor.objects.filter(user_id__in=touched).delete()
+        # Edges from users outside the candidates keep their old similarity until the next rebuild
+        UserNeighbor.objects.filter(neighbor_id=user_id, user_id__in=co_raters).exclude(user_id__in=touched).delete()
+        UserNeighbor.objects.bulk_create(links)
+
+
+def get_user_neighbors(user_id, k):
+    """Return up to ``k`` ``(neighbor_id, similarity)`` pairs from the table, most similar first."""
+    return list(
+        UserNeighbor.objects.filter(user_id=user_id).order_by('-similarity').values_list('neighbor_id', 'similarity')[:k]
+    )
@@ -1,18 +1,26 @@
+import asyncio
 from typing import Optional
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.models import User
-from django.db.models import Q, F, Avg
+from django.db.models import Case, When, Value
 from django.http import HttpResponse, JsonResponse
 from django.views import View
 from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from .models import Posts, Interaction, UserPreference, Category
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .hybridRS import HybridRecommender
-from .pagerank import PageRank
+from .model_store import get_current_model
+from .user_neighbors import get_user_neighbors, refresh_user_neighbors
+from .snapshots import discard_snapshot, snapshot_feed
+from .recommendation_cache import recommendation_cache
+from .search import search_posts, content_search_posts
+from .metrics import stage, registry, metrics_enabled
+from .async_feed import run_query, run_scoring, Overloaded
 import logging
 logger = logging.getLogger('django')
-import pandas as pd
 import os
 
 import sys
@@ -20,8 +28,6 @@ import sys
 # Create your views here.
 def home(request):
     posts = Posts.objects.all()
-    for post in posts:
-        post.avg_rating = post.average_rating()
     
     context = {
         'posts': posts
@@ -33,16 +39,12 @@ class SearchResultsView(ListView):
     template_name = 'blog/search_results.html'
 
     def get_queryset(self): # new
-        query = self.request.GET.get("q")
-        
-        posts = Posts.objects.filter(
-            Q(title__icontains=query) |
-            Q(author__username__icontains=query) |
-            Q(category__catName__icontains=query)
-            )
-        # interactions = Interaction.objects.all()
-        posts = posts.annotate(average_rating=Avg('interaction__rating')).order_by('-average_rating')
-        return posts
+        query = self.request.GET.get("q", "")
+        if self.request.GET.get("mode") == "content":
+            posts = model_search_posts(query)
+            if posts is not None:
+                return posts
+        return search_posts(query)
     
     # def get_context_data(self, **kwargs):
     #     context = super().get_context_data(**kwargs)
@@ -60,6 +62,53 @@ class SearchResultsView(ListView):
     #     return context
 
 
+def model_search_posts(query):
+    """Content search against the current model, or None if no model is published."""
+    recommender = get_current_model()
+    if recommender is None:
+        return None
+    return content_search_posts(recommender, query)
+
+
+class AsyncListMixin(object):
+    """Serve a ListView from an async ``get``.
+
+    The queryset comes from ``aget_queryset()``; pagination and template rendering
+    query the database, so they run on the database pool.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = await self.aget_queryset()
+        return await run_query(self.render_page)
+
+    def render_page(self):
+        return self.render_to_response(self.get_context_data()).render()
+
+
+class AsyncSearchResultsView(AsyncListMixin, SearchResultsView):
+    """SearchResultsView for ASGI; a slow or overloaded content search falls back to keyword search."""
+
+    async def aget_queryset(self):
+        query = self.request.GET.get("q", "")
+        if self.request.GET.get("mode") == "content":
+            try:
+                posts = await run_scoring(model_search_posts, query)
+            except (Overloaded, asyncio.TimeoutError):
+                logger.warning('Content search timed out or the scoring pool is full; using keyword search.')
+                posts = None
+            if posts is not None:
+                return posts
+        return await run_query(search_posts, query)
+
+
+def posts_in_rank_order(blog_ids):
+    """Posts with the given ids as a queryset ordered as listed."""
+    if not blog_ids:
+        return Posts.objects.none()
+    rank = Case(*[When(id=blog_id, then=Value(position)) for position, blog_id in enumerate(blog_ids)])
+    return Posts.objects.filter(id__in=blog_ids).order_by(rank)
+
+
 class PostListView(ListView):
     model = Posts
     template_name = 'blog/home.html'
@@ -68,28 +117,116 @@ class PostListView(ListView):
     paginate_by = 5
 
     print('PostListView rendered')
+    def get(self, request, *args, **kwargs):
+        with stage('feed'):
+            return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         user = self.request.user
         if user.is_authenticated:
-            interactions = Interaction.objects.filter(user_id = user.id)
-            if interactions.count() >= 5:
-                blog_df, rating_df, preferences_df, preferences_list = get_hybrid_recommendations(self.request)
-                hyrbidObject = HybridRecommender(blog_df, rating_df, preferences_df)
-                final_recommendations = hyrbidObject.recommend_blogs(user.id, preferences_list)
-
-                l = final_recommendations['blog_id']
-                posts = Posts.objects.filter(id__in = l)
-                return posts
+            has_history = history_count(user.id) >= settings.RECOMMENDER_MIN_INTERACTIONS
+            with stage('feed.snapshot'):
+                snapshot = snapshot_feed(user) if has_history else None
+            if snapshot is not None:
+                return snapshot
+            with stage('feed.load_model'):
+                recommender = get_current_model() if has_history else None
+            if recommender is not None:
+                preferences_list = preference_ids(user.id)
+                return posts_in_rank_order(recommended_blog_ids(recommender, user.id, preferences_list))
             else:
-                user_preferences = UserPreference.objects.filter(user_id=user.id).values_list('preference', flat=True)
-                preferences_list = list(user_preferences)
-                categories = Category.objects.filter(id__in=preferences_list).values_list('catName', flat=True)
-                category_names = list(categories)
-                posts = Posts.objects.filter(category__catName__in=category_names)
-                posts = posts.annotate(average_rating=Avg('interaction__rating')).order_by('-average_rating')
-                return posts  
+                if has_history:
+                    logger.warning('No recommender model has been published; run `manage.py build_recommender`.')
+                return preference_feed(preference_ids(user.id))
         else:
-            return Posts.objects.all().order_by('-date_posted')
+            return popularity_feed()
+
+
+def history_count(user_id):
+    with stage('feed.history'):
+        return Interaction.objects.filter(user_id=user_id).count()
+
+
+def preference_ids(user_id):
+    with stage('feed.preferences'):
+        return list(UserPreference.objects.filter(user_id=user_id).values_list('preference', flat=True))
+
+
+def preference_feed(preferences_list):
+    """Posts in the preferred categories, most popular first."""
+    categories = Category.objects.filter(id__in=preferences_list).values_list('catName', flat=True)
+    category_names = list(categories)
+    return Posts.objects.filter(category__catName__in=category_names).order_by('-popularity', '-date_posted')
+
+
+def popularity_feed():
+    return Posts.objects.all().order_by('-popularity', '-date_posted')
+
+
+def recommended_blog_ids(recommender, user_id, preferences_list):
+    """The user's recommendations from ``recommender``, served from the recommendation cache when fresh."""
+    def compute():
+        with stage('feed.user_neighbors'):
+            user_neighbors = get_user_neighbors(user_id, 5) or None
+        with stage('recommend'):
+            return recommender.recommend_blogs(user_id, preferences_list, user_neighbors=user_neighbors,
+                                               popular=Posts.most_popular)
+
+    with stage('feed.cached_recommendations'):
+        final_recommendations = recommendation_cache.get_or_compute(user_id, recommender.version, compute)
+    return final_recommendations['blog_id'].tolist()
+
+
+def score_feed(user_id, preferences_list):
+    """Load the current model and recommend for ``user_id``; None if no model is published."""
+    with stage('feed.load_model'):
+        recommender = get_current_model()
+    if recommender is None:
+        return None
+    return recommended_blog_ids(recommender, user_id, preferences_list)
+
+
+def authenticated_user(request):
+    # Resolving request.user loads the session and user from the database
+    return request.user if request.user.is_authenticated else None
+
+
+class AsyncPostListView(AsyncListMixin, PostListView):
+    """PostListView for ASGI.
+
+    The history, preference and snapshot queries run concurrently, and the model
+    is loaded and scored on the bounded scoring pool (see blog.async_feed). When
+    that pool is full or scoring exceeds RECOMMENDER_ASYNC_TIMEOUT the user gets
+    the popularity feed instead of waiting.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        # The queries run on the database pool, not this thread; the feed.* stages count them
+        with stage('feed', count_queries=False):
+            return await super().get(request, *args, **kwargs)
+
+    async def aget_queryset(self):
+        user = await run_query(authenticated_user, self.request)
+        if user is None:
+            return popularity_feed()
+        history, preferences_list, snapshot = await asyncio.gather(
+            run_query(history_count, user.id),
+            run_query(preference_ids, user.id),
+            run_query(snapshot_feed, user),
+        )
+        if history < settings.RECOMMENDER_MIN_INTERACTIONS:
+            return await run_query(preference_feed, preferences_list)
+        if snapshot is not None:
+            return snapshot
+        try:
+            blog_ids = await run_scoring(score_feed, user.id, preferences_list)
+        except (Overloaded, asyncio.TimeoutError):
+            logger.warning(f'Recommendations for user {user.id} timed out or the scoring pool is full; serving the popularity feed.')
+            return popularity_feed()
+        if blog_ids is None:
+            logger.warning('No recommender model has been published; run `manage.py build_recommender`.')
+            return await run_query(preference_feed, preferences_list)
+        return posts_in_rank_order(blog_ids)
 
 class UserPostListView(ListView):
     model = Posts
@@ -106,7 +243,7 @@ class PostDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['average_rating'] = self.object.average_rating()
+        context['average_rating'] = self.object.avg_rating
         context['stars'] = range(1, 6)  # 1 to 5 stars
         if self.request.user.is_authenticated:
             interaction = Interaction.objects.filter(user_id=self.request.user, blog_id=self.object).first()
@@ -157,21 +294,21 @@ class SubmitRatingView(View):
 
         post = get_object_or_404(Posts, id=post_id)
 
-        # Get or create the interaction (rating) for the post by the current user
-        interaction, created = Interaction.objects.get_or_create(user_id=request.user, blog_id=post)
+        with transaction.atomic():
+            # Get or create the interaction (rating) for the post by the current user
+            interaction, created = Interaction.objects.select_for_update().get_or_create(user_id=request.user, blog_id=post)
+            old_rating = Decimal(0) if created else interaction.rating
 
-        # Update the user's rating
-        interaction.rating = rating
-        interaction.save()
+            # Update the user's rating
+            interaction.rating = Decimal(str(rating)).quantize(Decimal('0.1'))
+            interaction.save()
 
-        # Calculate the average rating
-        all_ratings = Interaction.objects.filter(blog_id=post)
-        total_ratings = all_ratings.count()
+            # Fold the change into the post's running count/sum/average
+            avg_rating = Posts.record_rating(post.id, interaction.rating - old_rating, 1 if created else 0)
+        refresh_user_neighbors(request.user.id)
+        recommendation_cache.invalidate(request.user.id)
+        discard_snapshot(request.user.id)
 
-        if total_ratings > 0:
-            avg_rating = sum([interaction.rating for interaction in all_ratings]) / total_ratings
-        else:
-            avg_rating = 0  # Default to 0 if there are no ratings yet
         # Send the updated average rating and the user's rating
         return JsonResponse({
             'success': True,
@@ -180,26 +317,6 @@ class SubmitRatingView(View):
             'user_rating': rating  # Return the user's rating
         })
     
-def get_hybrid_recommendations(request):
-    blogData = Posts.objects.values('id', 'title', 'content', 'category__catName', 'author__username')
-    ratingData = Interaction.objects.values('user_id', 'blog_id', 'rating')
-    preferenceData = UserPreference.objects.values('user_id', 'preference')
-
-    # Convert to DataFrames
-    blog_df = pd.DataFrame(list(blogData))
-    blog_df.rename(columns={'id': 'blog_id'}, inplace=True)  # Rename to match expected schema
-
-    rating_df = pd.DataFrame(list(ratingData))
-    preferences_df = pd.DataFrame(list(preferenceData))
-
-    # Filter user-specific preferences
-    user_preference = UserPreference.objects.filter(user=request.user)
-
-    # Ensure the list contains only 'preference' strings
-    preferences_list = list(user_preference.values_list('preference', flat=True))  # Returns a list of strings
-
-    return blog_df, rating_df, preferences_df, preferences_list
-
 
 def pagerank_recommendations(request):
     print("Testing if function is called")
@@ -209,3 +326,26 @@ def pagerank_recommendations(request):
     print(preferences_list)
 
     return blogData, preferences_list
+
+
+class RecommendationCacheStatsView(UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(recommendation_cache.stats())
+
+
+class MetricsView(View):
+    """Stage histograms of this process, for staff users or requests from INTERNAL_IPS."""
+
+    def get(self, request):
+        if not metrics_enabled():
+            return HttpResponse('Metrics are disabled; set RECOMMENDER_METRICS_ENABLED = True.', status=404, content_type='text/plain')
+        if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+            return HttpResponse(status=403)
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'stages': registry.snapshot(), 'recommendation_cache': recommendation_cache.stats()})
+        cache_stats = recommendation_cache.stats()
+        counters = {f'blog_recommendation_cache_{name}_total': cache_stats[name] for name in ('hits', 'misses', 'invalidations')}
+        return HttpResponse(registry.render_prometheus(counters), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -133,6 +133,75 @@ LOGIN_REDIRECT_URL = 'blog-home'
 
 LOGIN_URL = 'login'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-user recommendation lists; use 'django.core.cache.backends.filebased.FileBasedCache'
+    # with a directory LOCATION to share entries between worker processes
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': 15 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Progress of interrupted `manage.py import_posts` runs, kept out of the source tree
+IMPORT_CHECKPOINT_DIR = BASE_DIR / 'import_checkpoints'
+
+# Ratings a user needs before the home feed is personalized
+RECOMMENDER_MIN_INTERACTIONS = 5
+# Fitted recommender models are written here by `manage.py build_recommender`
+RECOMMENDER_MODEL_DIR = BASE_DIR / 'recommender_models'
+# NLTK corpora are read from here before nltk's default locations and never downloaded at runtime;
+# `manage.py check_nltk_data --download` fills it
+RECOMMENDER_NLTK_DATA = os.environ.get('NLTK_DATA_DIR', BASE_DIR / 'nltk_data')
+# Post edits applied incrementally before `build_recommender --if-stale` refits from scratch
+RECOMMENDER_REBUILD_AFTER_UPDATES = 500
+# New ratings after which `manage.py run_recommender_worker` queues a rebuild
+RECOMMENDER_REBUILD_AFTER_INTERACTIONS = 1000
+# Seconds the worker sleeps when idle, and after which a job still marked running is assumed abandoned
+RECOMMENDER_WORKER_POLL_SECONDS = 30
+RECOMMENDER_JOB_STALE_AFTER = 6 * 60 * 60
+# Neighbors stored per user in the UserNeighbor table
+RECOMMENDER_USER_NEIGHBORS = 20
+# Co-raters considered when a rating refreshes a user's neighbors: those sharing the most blogs with the user
+RECOMMENDER_NEIGHBOR_REFRESH_CANDIDATES = 200
+# How the collaborative recommender finds similar users: 'exact' or 'lsh' (random-projection LSH)
+RECOMMENDER_NEIGHBOR_ENGINE = 'exact'
+# LSH hash tables (more = higher recall), bits per table (more = smaller buckets) and re-ranked candidates
+RECOMMENDER_LSH_TABLES = 16
+RECOMMENDER_LSH_BITS = 8
+RECOMMENDER_LSH_MAX_CANDIDATES = 1000
+# Collaborative recommendations from user kNN ('knn') or from factors trained by 'svd' or 'als'
+RECOMMENDER_COLLABORATIVE_BACKEND = 'knn'
+RECOMMENDER_FACTORS = 64
+RECOMMENDER_ALS_ITERATIONS = 10
+RECOMMENDER_ALS_REGULARIZATION = 0.1
+# Weight of each source's normalized scores when the home feed blends them
+RECOMMENDER_FUSION_WEIGHTS = {'content': 1.0, 'collaborative': 1.0}
+# Popularity is a damped average: every post starts with PRIOR_WEIGHT virtual ratings of PRIOR_MEAN.
+# Run `manage.py repair_rating_aggregates` after changing either.
+RECOMMENDER_POPULARITY_PRIOR_MEAN = 3.0
+RECOMMENDER_POPULARITY_PRIOR_WEIGHT = 5
+# Serve the home feed and search from async views; turn on when running under project1.asgi
+RECOMMENDER_ASYNC_VIEWS = False
+# Threads running the ORM queries of async views, and threads loading and scoring the model
+RECOMMENDER_ASYNC_DB_THREADS = 4
+RECOMMENDER_ASYNC_SCORING_THREADS = 2
+# Scoring jobs queued or running before new requests get the popularity feed straight away
+RECOMMENDER_ASYNC_MAX_PENDING = 8
+# Seconds an async feed waits for recommendations before serving the popularity feed
+RECOMMENDER_ASYNC_TIMEOUT = 2.0
+# Record per-stage timings and query counts of the feed, served at /metrics/
+RECOMMENDER_METRICS_ENABLED = False
+
+# Addresses allowed to read /metrics/ without logging in as staff
+INTERNAL_IPS = ['127.0.0.1']
+
 #EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 #EMAIL_HOST = 'smtp.gmail.com'
 #EMAIL_PORT = 587
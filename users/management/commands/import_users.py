@@ -1,68 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 import openpyxl
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from users.models import Profile
-from django.db import transaction
-from django.db.utils import IntegrityError
+from django.db import connection, transaction
 from tqdm import tqdm
 
+
+def _init_worker():
+    import django
+    django.setup()
+
+
 class Command(BaseCommand):
     help = 'Import users from an Excel file into the User table with custom IDs and optional empty fields.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=os.path.join('users', 'management', 'commands', 'sampled_authors.xlsx'),
+                            help='Excel workbook with author_id and author_name columns.')
+        parser.add_argument('--password', default='password123#', help='Password given to every imported user.')
+        parser.add_argument('--password-column', type=int, default=None,
+                            help='Zero-based column holding a per-user password, used instead of --password.')
+        parser.add_argument('--jobs', type=int, default=1,
+                            help='Processes used to hash per-user passwords (0 = one per CPU).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users written per query.')
+
     def handle(self, *args, **kwargs):
         # Path to the Excel file
-        excel_file = 'users/management/commands/sampled_authors.xlsx'
+        excel_file = kwargs['file']
+        password_column = kwargs['password_column']
+        batch_size = kwargs['batch_size']
 
-        # Load the workbook and select the first sheet
-        wb = openpyxl.load_workbook(excel_file)
-        sheet = wb.active
-
-        # List to hold new User objects to create
-        users_to_create = []
-        users_to_update = []
-
-        # Iterate through the rows in the Excel sheet (skip the header row)
-        for row in tqdm(sheet.iter_rows(min_row=2, values_only=True)):
-            password = 'password123#'
-            
-            # Access the values by index instead of string keys
+        # Read-only mode streams the rows instead of loading the whole workbook
+        wb = openpyxl.load_workbook(excel_file, read_only=True)
+        rows = {}
+        for row in tqdm(wb.active.iter_rows(min_row=2, values_only=True)):
             author_id = row[0]        # Assuming 'author_id' is in the first column
             author_name = row[1]      # Assuming 'author_name' is in the second column
+            password = row[password_column] if password_column is not None else kwargs['password']
+            rows[author_id] = (author_name, str(password))
+        wb.close()
+
+        # Hashing is the slow part: do each distinct password once rather than once per user
+        hashes = self.hash_passwords({password for _, password in rows.values()}, kwargs['jobs'])
 
-            # Try to get or update the user based on the custom id
-            user, created = User.objects.update_or_create(
+        # Diff against the users that already exist in one query
+        existing_ids = set(User.objects.filter(id__in=list(rows)).values_list('id', flat=True))
+        users_to_create = []
+        users_to_update = []
+        for author_id, (author_name, password) in rows.items():
+            user = User(
                 id=author_id,  # Set the custom user ID
-                defaults={
-                    'username': author_name,
-                    'password': password,
-                    'email': f"user_{author_id}@example.com"  # Optional email
-                }
+                username=author_name,
+                password=hashes[password],
+                email=f"user_{author_id}@example.com",  # Optional email
             )
+            (users_to_update if author_id in existing_ids else users_to_create).append(user)
 
-            if created:
-                # Only hash the password if the user is being created (new user)
-                user.set_password(password)
-                users_to_create.append(user)
-            else:
-                # Update password if the user already exists
-                user.set_password(password)  # Make sure to hash the password even on updates
-                users_to_update.append(user)
-
-        # Now handle users_to_create using bulk_create
-        if users_to_create:
-            User.objects.bulk_create(users_to_create)
+        with transaction.atomic():
+            User.objects.bulk_create(users_to_create, batch_size=batch_size)
+            User.objects.bulk_update(users_to_update, ['username', 'password', 'email'], batch_size=batch_size)
 
-        # Save users that need to be updated
-        for user in users_to_update:
-            user.save()  # Update existing users with the new details
+            # bulk_create skips the post_save signal, so create the missing profiles here
+            # (also without Profile.save(), which opens the default image for every row)
+            with_profile = set(Profile.objects.filter(user_id__in=list(rows)).values_list('user_id', flat=True))
+            Profile.objects.bulk_create(
+                [Profile(user_id=author_id) for author_id in rows if author_id not in with_profile],
+                batch_size=batch_size,
+            )
 
-        # Create profiles for each user (even for existing ones, if needed)
-        for user in users_to_create + users_to_update:
-            Profile.objects.get_or_create(user=user)
+            # Reset the sequence so Django handles new IDs automatically (a no-op on SQLite)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [User]):
+                    cursor.execute(sql)
 
-        # Optional: Reset the sequence so Django handles new IDs automatically
-        from django.db import connection
-        with connection.cursor() as cursor:
-            cursor.execute(f"SELECT setval('auth_user_id_seq', (SELECT MAX(id) FROM auth_user))")
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully imported users from Excel: {len(users_to_create)} created, {len(users_to_update)} updated.'
+        ))
 
-        self.stdout.write(self.style.SUCCESS('Successfully imported users from Excel.'))
+    def hash_passwords(self, passwords, jobs):
+        """Map each password to its hash, spreading the work over ``jobs`` processes when there are many."""
+        passwords = list(passwords)
+        jobs = jobs if jobs > 0 else os.cpu_count() or 1
+        if jobs == 1 or len(passwords) == 1:
+            return {password: make_password(password) for password in passwords}
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            return dict(zip(passwords, pool.map(make_password, passwords, chunksize=16)))